@@ -27,6 +27,9 @@ import pyMOE.utils as utils
 import pyMOE.holograms as holograms
 import pyMOE.generate as generate
 import pyMOE.sag_functions as sag
+import pyMOE.expression as expression
+import pyMOE.raster as raster
+import pyMOE.imagesource as imagesource
 
 
 __version__ = '1.4.1'
\ No newline at end of file
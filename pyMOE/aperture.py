@@ -8,10 +8,27 @@ Definition of Class Aperture
 """
 
 import numpy as np
+from collections import namedtuple
 from pyMOE.utils import digitize_array_to_bins
 from pyMOE.utils import discretize_array
 
 
+# Hashable descriptor of a regular grid, given by origin, pitch and number of points
+Grid = namedtuple("Grid", ["x0", "y0", "pixel_x", "pixel_y", "N_x", "N_y"])
+
+
+def grid_descriptor(x, y):
+    """
+    Returns the Grid descriptor (origin, pitch, shape) of the regular grid defined by the x and y vectors.
+    Comparing descriptors is O(1) instead of comparing the coordinates elementwise.
+    
+    Args:
+        :x:         Vector for the x axis
+        :y:         Vector for the y axis
+    """
+    return Grid(float(x[0]), float(y[0]), float(x[1]-x[0]), float(y[1]-y[0]), len(x), len(y))
+
+
 class Aperture:
     """
     Class Aperture:
@@ -25,17 +42,17 @@ class Aperture:
     Methods:
         :aperture:  returns the aperture
         :shape:     returns the shape of the aperture
+        :grid:      returns the Grid descriptor (origin, pitch, shape) of the aperture
 
     """
     def __init__(self, x, y):
         self.x = x
         self.y = y
-        self.XX, self.YY = np.meshgrid(x, y)
         self.pixel_x = self.x[1]-self.x[0]
         self.pixel_y = self.y[1]-self.y[0]
         
-        # XX.shape has the same shape as YY.shape
-        self.aperture = np.zeros(self.XX.shape)
+        # the aperture has the shape of the (y, x) grid
+        self.aperture = np.zeros(self.grid_shape)
         self.aperture_original = None
         self.levels = None
         self.aperture_discretized = None
@@ -45,8 +62,41 @@ class Aperture:
     def shape(self):
         return self.aperture.shape
 
-    def discretize(self, levels):
-        """Discretizes the aperture to the number of levels"""
+    @property
+    def grid_shape(self):
+        """Shape of the (y, x) grid of the aperture, same as np.meshgrid(x, y)"""
+        return (len(self.y), len(self.x))
+
+    @property
+    def grid(self):
+        """Hashable Grid descriptor (origin, pitch, shape) of the aperture"""
+        return grid_descriptor(self.x, self.y)
+
+    @property
+    def XX(self):
+        """x coordinates of the grid, as a read-only broadcasted view of the x axis"""
+        return np.broadcast_to(np.asarray(self.x)[None, :], self.grid_shape)
+
+    @property
+    def YY(self):
+        """y coordinates of the grid, as a read-only broadcasted view of the y axis"""
+        return np.broadcast_to(np.asarray(self.y)[:, None], self.grid_shape)
+
+    def discretize(self, levels, method=None, **dither_args):
+        """
+        Discretizes the aperture to the number of levels
+
+        Args:
+            :levels:        integer number of levels or array of levels (see utils.digitize_array_to_bins)
+            :method:        (optional) dithering method onto the levels (see dither.dither), e.g. "floyd_steinberg".
+                            Defaults to None, which digitizes each value to its bin
+            :dither_args:   additional arguments of dither.dither
+        """
+        if method is not None:
+            from pyMOE.dither import dither
+            dither(self, method, levels=levels, **dither_args)
+            return
+
         if self.aperture_original is None:
             self.aperture_original = np.copy(self.aperture)
         levels, digitized = digitize_array_to_bins(self.aperture, levels)
@@ -82,21 +132,41 @@ class ApertureField:
         :phase:     sets or returns the phase of the aperture array
         :unwrap:    retursn the unwrapped phase
         :shape:     returns the shape of the aperture
+        :grid:      returns the Grid descriptor (origin, pitch, shape) of the aperture
 
     """
     def __init__(self, x, y):
         self.x = x
         self.y = y
-        self.XX, self.YY = np.meshgrid(x, y)
         self.pixel_x = self.x[1]-self.x[0]
         self.pixel_y = self.y[1]-self.y[0]
         
 
-        self.aperture = np.ones(self.XX.shape)*np.exp(1j*np.zeros(self.XX.shape))
+        self.aperture = np.ones(self.grid_shape, dtype=complex)
 
     @property
     def shape(self):
         return self.aperture.shape
+
+    @property
+    def grid_shape(self):
+        """Shape of the (y, x) grid of the aperture, same as np.meshgrid(x, y)"""
+        return (len(self.y), len(self.x))
+
+    @property
+    def grid(self):
+        """Hashable Grid descriptor (origin, pitch, shape) of the aperture"""
+        return grid_descriptor(self.x, self.y)
+
+    @property
+    def XX(self):
+        """x coordinates of the grid, as a read-only broadcasted view of the x axis"""
+        return np.broadcast_to(np.asarray(self.x)[None, :], self.grid_shape)
+
+    @property
+    def YY(self):
+        """y coordinates of the grid, as a read-only broadcasted view of the y axis"""
+        return np.broadcast_to(np.asarray(self.y)[:, None], self.grid_shape)
     @property
     def amplitude(self):
         return np.abs(self.aperture)
@@ -1,90 +1,546 @@
-
 """
-dither.py 
-Module for dithering of masks/images 
+dither.py
+Module for dithering of masks/images
+
+Error diffusion algorithms (Floyd-Steinberg, Jarvis-Judice-Ninke, Stucki, Atkinson) quantize each pixel
+and diffuse its error to the pixels not yet processed, with optional serpentine scanning.
+Ordered algorithms (Bayer, blue noise) compare each pixel with a tiled threshold matrix and are fully vectorized.
+
+All the algorithms are available through dither(aperture, method=...) for Aperture objects and
+dither_array(array, method=...) for 2D arrays. Error diffusion of images that do not fit in memory
+is done by error_diffusion_tiled, over tiles of memory-mapped arrays in a pool of processes.
 """
 
-import cv2 
-import numpy as np 
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+import warnings
+
+import cv2
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from pyMOE.aperture import Aperture
+from pyMOE.imagesource import image_source
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# error diffusion kernels: list of (row offset, column offset, weight) and divisor of the weights
+ERROR_DIFFUSION_KERNELS = {
+    "floyd_steinberg": ([(0, 1, 7), (1, -1, 3), (1, 0, 5), (1, 1, 1)], 16),
+    "jarvis_judice_ninke": ([(0, 1, 7), (0, 2, 5),
+                             (1, -2, 3), (1, -1, 5), (1, 0, 7), (1, 1, 5), (1, 2, 3),
+                             (2, -2, 1), (2, -1, 3), (2, 0, 5), (2, 1, 3), (2, 2, 1)], 48),
+    "stucki": ([(0, 1, 8), (0, 2, 4),
+                (1, -2, 2), (1, -1, 4), (1, 0, 8), (1, 1, 4), (1, 2, 2),
+                (2, -2, 1), (2, -1, 2), (2, 0, 4), (2, 1, 2), (2, 2, 1)], 42),
+    "atkinson": ([(0, 1, 1), (0, 2, 1), (1, -1, 1), (1, 0, 1), (1, 1, 1), (2, 0, 1)], 8),
+}
+
+ORDERED_METHODS = ("bayer", "blue_noise")
+
+
+def _error_diffusion_loop(img, rows, cols, weights, divisor, levels, thresholds, h, w, pad, serpentine):
+    """
+    Error diffusion of img in place, pixel by pixel. Pixel (i, j) is img[i, j+pad] and the extra
+    rows and columns receive the error diffused out of the image. With serpentine, odd rows are
+    scanned from right to left with the kernel mirrored.
+    """
+    for i in range(h):
+        reverse = serpentine and (i % 2 == 1)
+        for k in range(w):
+            j = w-1-k if reverse else k
+            opix = img[i, j+pad]
+
+            level = 0
+            while (level < len(thresholds)) and (opix > thresholds[level]):
+                level += 1
+            vpix = levels[level]
+            img[i, j+pad] = vpix
+
+            err = opix - vpix
+            for n in range(len(weights)):
+                col = j+pad-cols[n] if reverse else j+pad+cols[n]
+                img[i+rows[n], col] = img[i+rows[n], col] + err * weights[n] / divisor
+
+
+if numba is not None:
+    _error_diffusion_numba = numba.njit(cache=True)(_error_diffusion_loop)
+
+
+def _wavefront_skew(offsets):
+    """
+    Smallest s such that pixel (i, j) can be processed at step j + s*i: every pixel is processed after
+    the pixels that diffuse error to it, and the errors reach each pixel in the same order as in the
+    pixel by pixel loop
+    """
+    s = 1
+    while not (all(dj + s*di >= 1 for di, dj in offsets) and
+               all(s*(di1-di2) >= dj2-dj1 for di1, dj1 in offsets for di2, dj2 in offsets if di1 > di2)):
+        s += 1
+    return s
+
+
+def _error_diffusion_wavefront(img, rows, cols, weights, divisor, levels, thresholds, h, w, pad, steps=None, row_range=None, origin=(0, 0)):
+    """
+    Error diffusion of img in place (see _error_diffusion_loop), vectorized over wavefronts.
+    All the pixels with the same j + s*i (see _wavefront_skew) are processed at once, and the errors
+    are added to each pixel in the same order as in the pixel by pixel loop, so the result is the same.
+
+    The steps and rows can be limited to process a part of the image (see error_diffusion_tiled), in which
+    case img is a block of the padded image with pixel (i, j) at img[i-origin[0], j-origin[1]+pad].
+    Returns the flat indices in img of the processed pixels.
+    """
+    s = _wavefront_skew(list(zip(rows, cols)))
+    row = img.shape[1]
+    flat = img.reshape(-1)
+    t0, t1 = (0, w + s*(h-1)) if steps is None else steps
+    i0, i1 = (0, h) if row_range is None else row_range
+    r_origin, j_origin = origin
+
+    # in each step, the errors are diffused in the order of the source pixels in the loop
+    order = sorted(range(len(weights)), key=lambda n: (-rows[n], -cols[n]))
+
+    processed = []
+    for t in range(t0, t1):
+        i = np.arange(max(i0, -(-(t-w+1)//s)), min(i1-1, t//s)+1)
+        if len(i) == 0:
+            continue
+        index = (i-r_origin)*row + (t-s*i-j_origin) + pad
+        processed.append(index)
+
+        opix = flat[index]
+        vpix = levels[np.searchsorted(thresholds, opix, side='left')]
+        flat[index] = vpix
+
+        err = opix - vpix
+        for n in order:
+            target = index + rows[n]*row + cols[n]
+            flat[target] = flat[target] + err * weights[n] / divisor
+
+    return np.concatenate(processed) if processed else np.zeros(0, dtype=int)
+
 
-def floyd_steinberg(input_img , plot = False ): 
+def _diffusion_parameters(kernel, levels, thresholds):
+    """Returns the offsets and weights of the kernel, and the levels and thresholds as arrays (see error_diffusion)"""
+    assert kernel in ERROR_DIFFUSION_KERNELS, "kernel must be one of %s"%(list(ERROR_DIFFUSION_KERNELS))
+    offsets, divisor = ERROR_DIFFUSION_KERNELS[kernel]
+    rows = np.array([o[0] for o in offsets])
+    cols = np.array([o[1] for o in offsets])
+    weights = np.array([o[2] for o in offsets], dtype=float)
+
+    levels = np.asarray(levels, dtype=float)
+    assert np.all(np.diff(levels) > 0), "levels must be increasing"
+    thresholds = (levels[1:]+levels[:-1])/2 if thresholds is None else np.asarray(thresholds, dtype=float)
+    assert len(thresholds) == len(levels)-1, "there must be one threshold less than levels"
+    return rows, cols, weights, divisor, levels, thresholds
+
+
+def error_diffusion(array, kernel="floyd_steinberg", levels=(0, 255), thresholds=None, serpentine=False, engine="auto"):
     """
-    Applies Floyd-Steinberg dithering algorithm to input image. 
-        
+    Quantizes the array to the levels with error diffusion
+
     Args:
-        :input_img: input image as a 2D grid (use cv2 img) 
-        :plot:      binary value, if True shows the plot, defaults to False 
-    
+        :array:         2D array of values
+        :kernel:        name of the kernel in ERROR_DIFFUSION_KERNELS, defaults to "floyd_steinberg"
+        :levels:        increasing values of the output levels, defaults to (0, 255)
+        :thresholds:    values above thresholds[k] are quantized to levels[k+1]. Defaults to the midpoints of the levels
+        :serpentine:    if True, scans odd rows from right to left, defaults to False
+        :engine:        "numba" (compiled loop, requires numba), "numpy" (vectorized over wavefronts of pixels) or
+                        "python" (pixel by pixel loop). All give the same result. Defaults to "auto", which
+                        uses numba if installed and numpy otherwise. Serpentine scanning cannot be vectorized
+                        over wavefronts, so it is not supported by "numpy", and "auto" without numba falls back
+                        to the (much slower) "python" pixel loop with a warning.
+
+    Returns:
+        :indices:       2D array with the index of the level of each pixel
     """
-    ###NOTE: considers the same pixel as in the image, possible improvement, change of pixel size 
+    rows, cols, weights, divisor, levels, thresholds = _diffusion_parameters(kernel, levels, thresholds)
 
-    #input image as provided 
-    img_gray_eq = input_img
-    
-    h,w = img_gray_eq.shape
+    h, w = array.shape
+    pad = int(np.max(np.abs(cols)))
+    img = np.zeros((h+int(np.max(rows)), w+2*pad))
+    img[0:h, pad:pad+w] = array
 
-    img_dither = np.zeros((h+1, w+1), dtype=np.float)
-    
-    threshold = 128
+    if engine == "auto":
+        engine = "numpy" if numba is None else "numba"
+        if (engine == "numpy") and serpentine:
+            warnings.warn("serpentine error diffusion without numba uses the pixel by pixel python loop, which is slow for large arrays")
+            engine = "python"
+    assert not ((engine == "numpy") and serpentine), "serpentine scanning is not supported by the numpy engine, please use engine='numba' or 'python'"
+
+    if engine == "numba":
+        assert numba is not None, "numba is not installed, please use engine='numpy'"
+        _error_diffusion_numba(img, rows, cols, weights, float(divisor), levels, thresholds, h, w, pad, serpentine)
+    elif engine == "numpy":
+        _error_diffusion_wavefront(img, rows, cols, weights, divisor, levels, thresholds, h, w, pad)
+    elif engine == "python":
+        _error_diffusion_loop(img, rows, cols, weights, divisor, levels, thresholds, h, w, pad, serpentine)
+    else:
+        raise ValueError("Unsuported engine!")
+
+    return np.searchsorted(levels, img[0:h, pad:pad+w])
+
+
+def _diffuse_tile(work_filename, kernel, levels, thresholds, tile):
+    """
+    Error diffusion of the pixels of one tile (see error_diffusion_tiled) in the memory-mapped work array.
+    Only the pixels of the tile and the pixels receiving its error are written back, so that the
+    tiles of the same wave can be processed concurrently.
+    """
+    rows, cols, weights, divisor, levels, thresholds = _diffusion_parameters(kernel, levels, thresholds)
+    s = _wavefront_skew(list(zip(rows, cols)))
+    pad = int(np.max(np.abs(cols)))
+
+    work = np.load(work_filename, mmap_mode="r+")
+    h = work.shape[0]-int(np.max(rows))
+    w = work.shape[1]-2*pad
+
+    r0, r1, u0, u1 = tile
+    j0 = max(0, u0-s*(r1-1))
+    j1 = min(w, u1-s*r0)
+    view = work[r0:r1+int(np.max(rows)), j0:j1+2*pad]
+    block = np.array(view)
+
+    processed = _error_diffusion_wavefront(block, rows, cols, weights, divisor, levels, thresholds, h, w, pad,
+                                           steps=(u0, u1), row_range=(r0, r1), origin=(r0, j0))
+
+    touched = np.zeros(block.shape, dtype=bool)
+    touched.flat[processed] = True
+    for di, dj in zip(rows, cols):
+        touched.flat[processed + di*block.shape[1] + dj] = True
+    view[touched] = block[touched]
+    work.flush()
+    del work
 
-    for i in np.arange(0,h):
-        for j in np.arange(0,w):
-            img_dither[i, j] = img_gray_eq[i, j]
-    
-    for i in np.arange(0,h):
-        for j in np.arange(0,w):
-            opix = img_dither[i, j]
-            if (img_dither[i, j] > threshold):
-                vpix = 255
+
+def error_diffusion_tiled(array, kernel="floyd_steinberg", levels=(0, 255), thresholds=None, tile_size=1024, workers=None,
+                          filename=None, tempdir=None):
+    """
+    Quantizes the array to the levels with error diffusion (see error_diffusion), processing tiles in a pool
+    of processes through memory-mapped arrays, for images that do not fit in memory.
+
+    The tiles are parallelograms of tile_size rows and tile_size wavefront steps (see _wavefront_skew), so the
+    error crossing the seams of each tile only reaches tiles that are processed later. The tiles are processed in
+    waves over the tile diagonals (tile (I, J) in wave 2*I+J), and the tiles of each wave are independent. The error
+    reaches each pixel in the same order as in the pixel by pixel loop, so the result is the same as error_diffusion.
+
+    The work array with the diffused error is a float64 .npy file with the size of the image (plus the kernel padding),
+    created in tempdir and deleted at the end, e.g. 80GB for a 100k x 100k mask.
+
+    Args:
+        :array:         2D array of values or image filename, read tile by tile (see imagesource.open_image)
+        :kernel:        name of the kernel in ERROR_DIFFUSION_KERNELS, defaults to "floyd_steinberg"
+        :levels:        increasing values of the output levels, defaults to (0, 255)
+        :thresholds:    values above thresholds[k] are quantized to levels[k+1]. Defaults to the midpoints of the levels
+        :tile_size:     number of rows and wavefront steps of each tile, defaults to 1024
+        :workers:       (optional) number of processes, defaults to None (serial)
+        :filename:      (optional) .npy file of the output, returned as a memory map. Defaults to None (array in memory)
+        :tempdir:       (optional) directory of the work array, defaults to the system temporary directory
+
+    Returns:
+        :indices:       2D array with the index of the level of each pixel (uint8 up to 256 levels)
+    """
+    with image_source(array) as array:
+        rows, cols, weights, divisor, levels_array, thresholds_array = _diffusion_parameters(kernel, levels, thresholds)
+        s = _wavefront_skew(list(zip(rows, cols)))
+        reach = int(np.max(cols + s*rows))
+        assert tile_size > reach, "tile_size must be larger than %d for the %s kernel"%(reach, kernel)
+
+        h, w = array.shape
+        pad = int(np.max(np.abs(cols)))
+        dtype = np.uint8 if len(levels_array) <= 256 else np.uint32
+
+        # parallelogram tiles with pixels, grouped by wave
+        waves = {}
+        for I, r0 in enumerate(range(0, h, tile_size)):
+            r1 = min(r0+tile_size, h)
+            i = np.arange(r0, r1)
+            for J, u0 in enumerate(range(0, w + s*(h-1), tile_size)):
+                u1 = u0+tile_size
+                if np.any((u0-s*i < w) & (u1-s*i > 0)):
+                    waves.setdefault(2*I+J, []).append((r0, r1, u0, u1))
+
+        with tempfile.TemporaryDirectory(dir=tempdir) as directory:
+            work_filename = os.path.join(directory, "work.npy")
+            work = open_memmap(work_filename, mode="w+", dtype=np.float64, shape=(h+int(np.max(rows)), w+2*pad))
+            for r0 in range(0, h, tile_size):
+                r1 = min(r0+tile_size, h)
+                work[r0:r1, pad:pad+w] = array[r0:r1]
+            work.flush()
+
+            diffuse = partial(_diffuse_tile, work_filename, kernel, tuple(levels_array), tuple(thresholds_array))
+            if workers is None:
+                for wave in sorted(waves):
+                    for tile in waves[wave]:
+                        diffuse(tile)
             else:
-                vpix = 0
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    for wave in sorted(waves):
+                        list(executor.map(diffuse, waves[wave]))
 
-            img_dither[i, j] = vpix
+            if filename is None:
+                indices = np.zeros((h, w), dtype=dtype)
+            else:
+                indices = open_memmap(filename, mode="w+", dtype=dtype, shape=(h, w))
+            for r0 in range(0, h, tile_size):
+                r1 = min(r0+tile_size, h)
+                indices[r0:r1] = np.searchsorted(levels_array, work[r0:r1, pad:pad+w])
+            del work
 
-            err = opix - vpix
+        return indices
 
-            if j > 0:
-                img_dither[i+1, j-1] = img_dither[i+1, j-1] + err * 3 / 16
-            img_dither[i+1, j] = img_dither[i+1, j] + err * 5 / 16
-            img_dither[i, j+1] = img_dither[i, j+1] + err * 7 / 16
-            img_dither[i+1, j+1] = img_dither[i+1, j+1] + err * 1 / 16
 
+def bayer_matrix(n):
+    """
+    Returns the n x n Bayer threshold matrix (n power of 2), with values in ]0, 1[
+    """
+    assert (n >= 1) and (n & (n-1) == 0), "n must be a power of 2"
+    matrix = np.zeros((1, 1), dtype=int)
+    while len(matrix) < n:
+        matrix = np.block([[4*matrix, 4*matrix+2], [4*matrix+3, 4*matrix+1]])
+    return (matrix+0.5)/n**2
+
+
+@lru_cache(maxsize=None)
+def _blue_noise_ranks(n, sigma, seed):
+    """Ranks of the pixels of a n x n blue noise pattern, with the void-and-cluster algorithm (Ulichney)"""
+    # gaussian energy kernel on the torus, centered at pixel (0, 0)
+    d = np.minimum(np.arange(n), n-np.arange(n))
+    kernel = np.exp(-(d[:, None]**2 + d[None, :]**2)/(2*sigma**2))
+
+    def energy_of(pattern):
+        return np.real(np.fft.ifft2(np.fft.fft2(pattern)*np.fft.fft2(kernel)))
+
+    def toggle(pattern, energy, index, value):
+        pattern.flat[index] = value
+        energy += (1 if value else -1)*np.roll(kernel, np.unravel_index(index, (n, n)), axis=(0, 1))
+
+    def tightest_cluster(pattern, energy):
+        return np.argmax(np.where(pattern, energy, -np.inf))
+
+    def largest_void(pattern, energy):
+        return np.argmin(np.where(pattern, np.inf, energy))
+
+    # initial pattern with the minority pixels spread out
+    rng = np.random.default_rng(seed)
+    prototype = np.zeros((n, n), dtype=bool)
+    prototype.flat[rng.choice(n*n, max(1, n*n//10), replace=False)] = True
+    energy = energy_of(prototype)
+    while True:
+        cluster = tightest_cluster(prototype, energy)
+        toggle(prototype, energy, cluster, False)
+        void = largest_void(prototype, energy)
+        toggle(prototype, energy, void, True)
+        if void == cluster:
+            break
+
+    ranks = np.zeros(n*n, dtype=int)
+    ones = int(prototype.sum())
+
+    # removes the minority pixels from the tightest clusters
+    pattern = prototype.copy()
+    energy = energy_of(pattern)
+    for rank in range(ones-1, -1, -1):
+        cluster = tightest_cluster(pattern, energy)
+        toggle(pattern, energy, cluster, False)
+        ranks[cluster] = rank
+
+    # fills the largest voids
+    pattern = prototype.copy()
+    energy = energy_of(pattern)
+    for rank in range(ones, n*n):
+        void = largest_void(pattern, energy)
+        toggle(pattern, energy, void, True)
+        ranks[void] = rank
+
+    return ranks.reshape(n, n)
+
+
+def blue_noise_matrix(n=64, sigma=1.5, seed=0):
+    """
+    Returns a n x n blue noise threshold matrix, with values in ]0, 1[
+
+    Args:
+        :n:         size of the matrix, defaults to 64
+        :sigma:     width of the gaussian filter of the void-and-cluster algorithm, defaults to 1.5
+        :seed:      seed of the random initial pattern, defaults to 0
+    """
+    return (_blue_noise_ranks(n, sigma, seed)+0.5)/n**2
+
+
+def ordered_dither(array, matrix, levels=(0, 255)):
+    """
+    Quantizes the array to the levels by comparing the position of each value between two levels with
+    the threshold matrix tiled over the array
+
+    Args:
+        :array:     2D array of values
+        :matrix:    threshold matrix with values in ]0, 1[ (e.g. bayer_matrix or blue_noise_matrix)
+        :levels:    increasing values of the output levels, defaults to (0, 255)
+
+    Returns:
+        :indices:   2D array with the index of the level of each pixel
+    """
+    levels = np.asarray(levels, dtype=float)
+    assert np.all(np.diff(levels) > 0), "levels must be increasing"
+    h, w = array.shape
+    m, n = matrix.shape
+
+    values = np.clip(array, levels[0], levels[-1])
+    lower = np.clip(np.searchsorted(levels, values, side='right')-1, 0, len(levels)-2)
+    fraction = (values-levels[lower])/(levels[lower+1]-levels[lower])
+    threshold = np.tile(matrix, (-(-h//m), -(-w//n)))[0:h, 0:w]
+
+    return lower + (fraction > threshold)
+
+
+def dither_array(array, method="floyd_steinberg", levels=(0, 255), thresholds=None, serpentine=False, engine="auto", matrix_size=None,
+                 tile_size=None, workers=None):
+    """
+    Quantizes the array to the levels with the dithering method
+
+    Args:
+        :array:         2D array of values
+        :method:        error diffusion kernel in ERROR_DIFFUSION_KERNELS ("floyd_steinberg", "jarvis_judice_ninke",
+                        "stucki", "atkinson") or ordered method ("bayer", "blue_noise"). Defaults to "floyd_steinberg"
+        :levels:        increasing values of the output levels, defaults to (0, 255)
+        :thresholds:    (error diffusion only) values above thresholds[k] are quantized to levels[k+1]. Defaults to the midpoints of the levels
+        :serpentine:    (error diffusion only) if True, scans odd rows from right to left, defaults to False
+        :engine:        (error diffusion only) "auto", "numba", "numpy" or "python" (see error_diffusion)
+        :matrix_size:   (ordered only) size of the threshold matrix, defaults to 8 for bayer and 64 for blue_noise
+        :tile_size:     (error diffusion only) if given, processes tiles of this size (see error_diffusion_tiled)
+        :workers:       (error diffusion only) number of processes for the tiles, defaults to None (serial)
+
+    Returns:
+        :indices:       2D array with the index of the level of each pixel
+    """
+    if (method in ERROR_DIFFUSION_KERNELS) and (tile_size is not None):
+        assert not serpentine, "serpentine scanning is not supported with tiles"
+        return error_diffusion_tiled(array, method, levels, thresholds, tile_size, workers)
+    elif method in ERROR_DIFFUSION_KERNELS:
+        return error_diffusion(array, method, levels, thresholds, serpentine, engine)
+    elif method == "bayer":
+        return ordered_dither(array, bayer_matrix(8 if matrix_size is None else matrix_size), levels)
+    elif method == "blue_noise":
+        return ordered_dither(array, blue_noise_matrix(64 if matrix_size is None else matrix_size), levels)
+    else:
+        raise ValueError("Unsuported method! Use one of %s"%(list(ERROR_DIFFUSION_KERNELS)+list(ORDERED_METHODS)))
+
+
+def dither(aperture, method="floyd_steinberg", serpentine=False, engine="auto", matrix_size=None, tile_size=None, workers=None,
+           levels=None):
+    """
+    Dithers the aperture into discrete levels, as a discretized aperture (see Aperture.discretize), which can be
+    converted with GDSMask. The local mean of the dithered aperture follows the continuous aperture instead of
+    the contours of hard quantization.
+
+    Args:
+        :aperture:      aperture of type Aperture
+        :method:        dithering method (see dither_array), defaults to "floyd_steinberg"
+        :serpentine:    (error diffusion only) if True, scans odd rows from right to left, defaults to False
+        :engine:        (error diffusion only) "auto", "numba", "numpy" or "python" (see error_diffusion)
+        :matrix_size:   (ordered only) size of the threshold matrix
+        :tile_size:     (error diffusion only) if given, processes tiles of this size (see error_diffusion_tiled)
+        :workers:       (error diffusion only) number of processes for the tiles, defaults to None (serial)
+        :levels:        integer number of levels or array of levels, with the levels of Aperture.discretize
+                        (see utils.digitize_array_to_bins). Defaults to None, the minimum and maximum of the aperture
+
+    Returns:
+        :aperture:      dithered aperture
+    """
+    assert type(aperture) is Aperture, "aperture must be of type Aperture"
+    if aperture.aperture_original is None:
+        aperture.aperture_original = np.copy(aperture.aperture)
+
+    if levels is None:
+        levels = np.array([np.min(aperture.aperture), np.max(aperture.aperture)])
+    elif isinstance(levels, int):
+        levels = np.linspace(np.min(aperture.aperture), np.max(aperture.aperture), levels, endpoint=False)
+    levels = np.asarray(levels, dtype=float)
+    assert len(levels) > 1, "there must be more than one level"
+    assert np.all(np.diff(levels) > 0), "levels must be increasing and aperture must have more than one value"
+
+    # values outside the levels cannot be represented and would accumulate error
+    values = np.clip(aperture.aperture, levels[0], levels[-1])
+    digitized = dither_array(values, method, levels, serpentine=serpentine, engine=engine, matrix_size=matrix_size,
+                             tile_size=tile_size, workers=workers)
+
+    aperture.levels = levels
+    aperture.aperture_discretized = digitized
+    aperture.aperture = levels[digitized]
+    aperture.discretized_flag = True
+    return aperture
+
+
+def floyd_steinberg(input_img , plot = False, engine = "auto", tile_size = None, workers = None):
+    """
+    Applies Floyd-Steinberg dithering algorithm to input image.
+
+    Args:
+        :input_img: input image as a 2D grid (use cv2 img)
+        :plot:      binary value, if True shows the plot, defaults to False
+        :engine:    "numba" (compiled loop, requires numba), "numpy" (vectorized over wavefronts of pixels) or
+                    "python" (pixel by pixel loop). All give the same result. Defaults to "auto", which
+                    uses numba if installed and numpy otherwise.
+        :tile_size: if given, dithers tiles of this size through memory maps (see error_diffusion_tiled), defaults to None
+        :workers:   number of processes for the tiles, defaults to None (serial)
+
+    """
+    ###NOTE: considers the same pixel as in the image, possible improvement, change of pixel size
+
+    #input image as provided
+    img_gray_eq = input_img
+
+    threshold = 128
+    levels = np.array([0, 255])
+
+    if tile_size is None:
+        img_dither = levels[error_diffusion(img_gray_eq, "floyd_steinberg", levels, [threshold], engine=engine)]
+    else:
+        img_dither = levels[error_diffusion_tiled(img_gray_eq, "floyd_steinberg", levels, [threshold], tile_size, workers)]
     img_dither = img_dither.astype(np.uint8)
-    img_dither = img_dither[0:h, 0:w]
-    
-    if plot == True: 
-        import matplotlib.pyplot as plt 
+
+    if plot == True:
+        import matplotlib.pyplot as plt
         fig = plt.figure()
         plt.imshow(255-img_dither, vmin=0, vmax=255, cmap=plt.get_cmap("Greys"))
 
     #cv2.imwrite(output_filename, img_dither_inv)
-    
+
     return img_gray_eq, img_dither
-    
-    
-def dither_img(input_img, output_filename, plotting = False): 
+
+
+def dither_img(input_img, output_filename, plotting = False, method = "floyd_steinberg"):
     """
     Returns a make dithered image from input_img, save to output_img.
-        
+
     Args:
-        :inputcv2:          input image as a 2D grid (use cv2 img)  
-        :output_filename:   filename of image to be written 
-        :plotting:          binary value, if True shows the plot, defaults to False 
+        :input_img:         input image filename or array (see imagesource.open_image)
+        :output_filename:   filename of image to be written
+        :plotting:          binary value, if True shows the plot, defaults to False
+        :method:            dithering method (see dither_array), defaults to "floyd_steinberg"
     """
 
-    img_gray0 = cv2.imread(input_img, cv2.IMREAD_GRAYSCALE)
+    with image_source(input_img) as img:
+        img_gray0 = np.asarray(img)
     #img_gray0 = 255 - img_gray0
-    
-    #possible IMPROVEMENT considering passing any dithering algorithm as argument to to dither_img 
-    img_gray_eq, img_dither= floyd_steinberg(img_gray0, plot = plotting)
-
-    cv2.imwrite(output_filename, img_dither)
-    
-    del img_gray_eq, img_dither
-    
-    
-    
-####missing other possible algorithms 
 
+    if method == "floyd_steinberg":
+        img_gray_eq, img_dither= floyd_steinberg(img_gray0, plot = plotting)
+    else:
+        img_gray_eq = img_gray0
+        img_dither = (255*dither_array(img_gray0, method)).astype(np.uint8)
+        if plotting == True:
+            import matplotlib.pyplot as plt
+            fig = plt.figure()
+            plt.imshow(255-img_dither, vmin=0, vmax=255, cmap=plt.get_cmap("Greys"))
 
+    cv2.imwrite(output_filename, img_dither)
 
+    del img_gray_eq, img_dither
@@ -3,19 +3,112 @@ export.py
 Module containing several functions to export masks to gds. 
 
 """
-import cv2
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+import warnings
+
 import gdspy 
 import numpy as np 
+import pya 
+
+from pyMOE.gds_klops import box_region, gds_output, write_layout
+from pyMOE.imagesource import image_source
+import pyMOE.raster as raster
+    
+    
+
+def image_rectangles(img, pixelx, pixely, r0=0, c0=0, levels=None):
+    """
+    Converts all the gray levels of an image (or of a tile of an image) into rectangles in a single 
+    vectorized pass (see raster.raster_rectangles). Pixel (i, j) of the image is the rectangle from 
+    (pixelx*j, -pixely*i) to (pixelx*(j+1), -pixely*(i+1)), as in grayim2gds. 
+    
+    Args:
+        :img:       2D array of gray levels 
+        :pixelx:    pixel size in x, in um 
+        :pixely:    pixel size in y, in um 
+        :r0, c0:    (optional) row and column of the first pixel of img in the whole image, default 0
+        :levels:    (optional) list of gray levels to convert, defaults to None (all levels)
+    
+    Returns:
+        list of (level, polygons) with the polygons of each level as an array with shape (n, 4, 2)
+    """
+    values, rr0, rr1, cc0, cc1 = raster.raster_rectangles(img)
+    if levels is not None:
+        keep = np.isin(values, levels)
+        values, rr0, rr1, cc0, cc1 = values[keep], rr0[keep], rr1[keep], cc0[keep], cc1[keep]
+    
+    polygons = raster.rectangle_polygons(pixelx*(c0+cc0), -pixely*(r0+rr1), pixelx*(c0+cc1), -pixely*(r0+rr0))
+    
+    # groups the rectangles by level
+    order = np.argsort(values, kind="stable")
+    unique_levels, starts = np.unique(values[order], return_index=True)
+    return [(level, polygons[group]) for level, group in zip(unique_levels, np.split(order, starts[1:]))]
+
+
+def grayim2gds_levels(infile, outfile, pixelx, pixely, cellname="TOP", levels=None, datatype=0, band_rows=1024, verbose=False):
+    """
+    (void) Transforms one image (converted to grayscale) into a gds with each gray level in its own layer 
+    (layer = gray level), in a single pass over the image. The image is converted in bands of band_rows rows 
+    into run-length rectangles (see image_rectangles), and each band is streamed with gdspy.GdsWriter as 
+    a cell referenced by the top cell, so that only the polygons of one band are kept in memory. 
+    
+    Args:
+        :infile:    input IMAGE file or opened image, e.g. "image.png" or "image.npy" (see imagesource.open_image)
+        :outfile:   output GDS file, e.g. "image.gds" (or OASIS file, e.g. "image.oas")
+        :pixelx:    pixel size in x, in um 
+        :pixely:    pixel size in y, in um 
+        :cellname:  (optional) string with the name of the top cell, defaults to "TOP"
+        :levels:    (optional) list of gray levels (0 to 255) to export, defaults to None (all levels)
+        :datatype:  (optional) gds datatype, defaults to 0 
+        :band_rows: (optional) number of image rows in each band cell, defaults to 1024
+        :verbose:   (optional) defaults to False, if True prints 
     
+    ---- 
+    Usage example: 
+    
+    infilxe = "image.png"
+    outfilxe = "image.gds"
+    pixelx = 1 #um 
+    pixely = 1 #um 
+    grayim2gds_levels(infilxe, outfilxe, pixelx, pixely, "TOP")
+    """
+    with image_source(infile) as img:
+        h,w = img.shape 
+    
+        topcell = gdspy.Cell(cellname, exclude_from_current=True)
+        exported_levels = set()
+    
+        with gds_output(outfile) as gdsfile:
+            writer = gdspy.GdsWriter(gdsfile, unit=1.0e-6, precision=1.0e-9)
+            for band, r0 in enumerate(range(0, h, band_rows)):
+                if verbose == True: 
+                    print(r0/h)
+                bandcell = gdspy.Cell("%s_%d"%(cellname, band), exclude_from_current=True)
+                for level, polygons in image_rectangles(np.asarray(img[r0:r0+band_rows]), pixelx, pixely, r0=r0, levels=levels):
+                    bandcell.add(gdspy.PolygonSet(list(polygons), int(level), datatype))
+                    exported_levels.add(int(level))
+                if len(bandcell.polygons) > 0:
+                    writer.write_cell(bandcell)
+                    # the reference is made by name, as the band cells are not kept in memory
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("ignore")
+                        topcell.add(gdspy.CellReference(bandcell.name))
+            writer.write_cell(topcell)
+            writer.close()
     
+        print("Exported %d gray levels of the image file %s into %s"%(len(exported_levels), str(infile), str(outfile)))
+    
+
 ###Function exports an image file (converted to gray) into a gds file 
 def grayim2gds(infile, outfile, pixelx, pixely, cellname, level, layer=0, datatype=0, verbose=False):
     """
     (void) Transforms one image (converted to grayscale) into a gds, using cv2 
     
     Args: 
-        :infile:    input IMAGE file (on extension that cv2 can read ), e.g. "image.png"
-        :outfile:   output GDS file, e.g. "image.gds"
+        :infile:    input IMAGE file or opened image, e.g. "image.png" or "image.npy" (see imagesource.open_image)
+        :outfile:   output GDS file, e.g. "image.gds" (or OASIS file, e.g. "image.oas")
         :pixelx:    pixel size in x, in um 
         :pixely:    pixel size in y, in um 
         :cellname:  string with cellname, e.g. "TOP"
@@ -33,48 +126,61 @@ def grayim2gds(infile, outfile, pixelx, pixely, cellname, level, layer=0, dataty
     pixely = 1 #um 
     grayim2gds(infilxe, outfilxe, pixelx, pixely,"TOP", 0)
     """
-    img = cv2.imread(infile, cv2.IMREAD_GRAYSCALE)
+    with image_source(infile) as img:
     
-    h,w = img.shape 
-    #print(h)
-    #print(w)
+        h,w = img.shape 
+        #print(h)
+        #print(w)
 
-    pols=[]
-    for i in np.arange(0,h):
-        if verbose == True: 
-            print(i/h)
-        for j in np.arange(0, w):
-            #print(j/w)
-            #here we can also think of selectin pixels at a certain level only
-            #and creating a GDS from a grayscale image 
-            if img[i][j] == int(level):
-                #print(i)
-                #rectangle takes the two  opposite corners 
-                pols.append(gdspy.Rectangle((pixelx*j,-pixely*i),(pixelx*(j+1), -pixely*(i+1)), layer, datatype))
+        pols=[]
+        for i in np.arange(0,h):
+            if verbose == True: 
+                print(i/h)
+            row = np.asarray(img[i])
+            for j in np.arange(0, w):
+                #print(j/w)
+                #here we can also think of selectin pixels at a certain level only
+                #and creating a GDS from a grayscale image 
+                if row[j] == int(level):
+                    #print(i)
+                    #rectangle takes the two  opposite corners 
+                    pols.append(gdspy.Rectangle((pixelx*j,-pixely*i),(pixelx*(j+1), -pixely*(i+1)), layer, datatype))
 
-    if len(pols) !=0: 
-        polygons=gdspy.boolean(pols[0], pols[1:], "or") #max_points could be used
+        if len(pols) !=0: 
+            polygons=gdspy.boolean(pols[0], pols[1:], "or") #max_points could be used
 
-        #define current as Gdslib with default properties unit=1e-06, precision=1e-09
-        gdspy.current_library = gdspy.GdsLibrary() 
-        cell = gdspy.Cell(cellname)
-        cell.add(polygons)
-        gdspy.write_gds(outfile)
-        print("Exported the image file "+str(infile) + " into " + str(outfile))
+            #define current as Gdslib with default properties unit=1e-06, precision=1e-09
+            gdspy.current_library = gdspy.GdsLibrary() 
+            cell = gdspy.Cell(cellname)
+            cell.add(polygons)
+            with gds_output(outfile) as gdsfile:
+                gdspy.write_gds(gdsfile)
+            print("Exported the image file "+str(infile) + " into " + str(outfile))
         
-    else: 
-        print("There are no pixels in this gray level! Please try another gray level.")
+        else: 
+            print("There are no pixels in this gray level! Please try another gray level.")
 
     
-def grayim2gds_writer_frac(infile, outfile, pixelx, pixely, cellname, level, nm=None, layer=0, datatype=0 , verbose=False):
+def _tile_polygons(tile, pixelx, pixely, level):
+    """Rectangles of the pixels at the gray level in a tile (img_tile, r0, c0) of the image (see image_rectangles)"""
+    img_tile, r0, c0 = tile
+    return image_rectangles(img_tile, pixelx, pixely, r0, c0, levels=[level])
+
+
+def grayim2gds_writer_frac(infile, outfile, pixelx, pixely, cellname, level, nm=None, layer=0, datatype=0 , verbose=False, workers=None):
     """
     (void) Transforms one image (converted to grayscale) into a gds, using cv2 
     
     By default adds the image to (layer, datatype) = (0,0)
     
+    The image is fractured into tiles of nm x nm pixels, converted into run-length rectangles (see image_rectangles), 
+    optionally in a pool of processes. Each tile is streamed with gdspy.GdsWriter into its own cell 
+    (cellname_row_column) of the single output file, referenced by the top cell, so that only the polygons 
+    of a few tiles are kept in memory. 
+    
     Args:
-        :infile:    input IMAGE file (on extension that cv2 can read ), e.g. "image.png"
-        :outfile:   output GDS file, e.g. "image.gds"
+        :infile:    input IMAGE file or opened image, e.g. "image.png" or "image.npy" (see imagesource.open_image)
+        :outfile:   output GDS file, e.g. "image.gds" (or OASIS file, e.g. "image.oas")
         :pixelx:    pixel size in x, in um 
         :pixely:    pixel size in y, in um 
         :cellname:  string with cellname, e.g. "TOP"
@@ -83,6 +189,7 @@ def grayim2gds_writer_frac(infile, outfile, pixelx, pixely, cellname, level, nm=
         :layer:     (optional) gray level, defaults to 0 
         :datatype:  (optional) gds datatype, defaults to 0 
         :verbose:   (optional) defaults to False, if True prints 
+        :workers:   (optional) number of processes converting the tiles, defaults to None (serial)
     
     ---- 
     Usage example: 
@@ -98,66 +205,52 @@ def grayim2gds_writer_frac(infile, outfile, pixelx, pixely, cellname, level, nm=
     grayim2gds_writer_frac(infilxe, outfilxe, pixelx, pixely, cellname, graycolor, frac, verbose=True) 
     """
 
-    img = cv2.imread(infile, cv2.IMREAD_GRAYSCALE)
+    with image_source(infile) as img:
     
-    if img is not None: 
-        print("Sucessfully imported img!")
+        if img is not None: 
+            print("Sucessfully imported img!")
         
-    h,w = img.shape 
-    print(h)
-    print(w)
-    
-    if nm == None:
-        nmx = w
-        nmy = h
-    else: 
-        nmx = nm
-        nmy = nm
-    
-    harray = np.arange(0,h+1,nmy)
-    warray = np.arange(0,w+1,nmx)
-    cn = 1
-    #print(harray)
-    
-    for hn, hi in enumerate(harray):
-        if hn == (len(harray)-1):
-
-            break
-        #print(hi)
-        for hw, wi in enumerate(warray):
-            if hw == (len(warray)-1): 
-                break
-                
-            #print(wi)
-            
-            pols=[]
-
-            gdspy.current_library = gdspy.GdsLibrary() 
-            lib = gdspy.GdsLibrary()
-            outfilen = str(cn)+outfile
-            writer = gdspy.GdsWriter(outfilen,unit=1.0e-6,precision=1.0e-9)
-            cell = lib.new_cell(cellname)
-
-            for i in np.arange(hi,hi+nmy):
-                cell.remove_polygons(lambda pts, layer, datatype: layer == 0)
-                if verbose == True: 
-                    print(i/h)
-                for j in np.arange(wi, wi+nmx):
-                    #print(j/w)
-                    #here we can also think of selectin pixels at a certain level only
-                    #and creating a GDS from a grayscale image 
-                    if img[i][j] == int(level):
-                        #rectangle takes the two  opposite corners 
-                        pols.append(gdspy.Rectangle((pixelx*j,-pixely*i),(pixelx*(j+1), -pixely*(i+1)), layer, datatype))
-
-            cell.add(pols)
-            writer.write_cell(cell)
-            del cell
+        h,w = img.shape 
+        print(h)
+        print(w)
+    
+        nm = max(h, w) if nm is None else nm
+        blocks = list(raster.iterate_blocks((h, w), nm))
+        total_tiles = len(blocks)
+    
+        tiles = ((np.asarray(img[r0:r1, c0:c1]), r0, c0) for r0, r1, c0, c1 in blocks)
+        convert = partial(_tile_polygons, pixelx=pixelx, pixely=pixely, level=int(level))
+    
+        topcell = gdspy.Cell(cellname, exclude_from_current=True)
+    
+        with gds_output(outfile) as gdsfile:
+            writer = gdspy.GdsWriter(gdsfile, unit=1.0e-6, precision=1.0e-9)
+            executor = None if workers is None else ProcessPoolExecutor(max_workers=workers)
+            try:
+                # the tiles are converted in batches, to bound the polygons waiting to be written
+                batch_size = 1 if workers is None else 4*workers
+                for b in range(0, total_tiles, batch_size):
+                    batch = list(islice(tiles, batch_size))
+                    results = map(convert, batch) if executor is None else executor.map(convert, batch)
+                    for n, ((r0, r1, c0, c1), result) in enumerate(zip(blocks[b:b+batch_size], results), start=b):
+                        if verbose == True: 
+                            print("Tile %d of %d"%(n+1, total_tiles))
+                        tilecell = gdspy.Cell("%s_%d_%d"%(cellname, r0//nm, c0//nm), exclude_from_current=True)
+                        for _, polygons in result:
+                            tilecell.add(gdspy.PolygonSet(list(polygons), layer, datatype))
+                        if len(tilecell.polygons) > 0:
+                            writer.write_cell(tilecell)
+                            # the reference is made by name, as the tile cells are not kept in memory
+                            with warnings.catch_warnings():
+                                warnings.simplefilter("ignore")
+                                topcell.add(gdspy.CellReference(tilecell.name))
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+            writer.write_cell(topcell)
             writer.close()
-            cn = cn+1
 
-    #print(cn)
-    print("Exported the image file "+str(infile) + " into " + str(outfile))
+        print("Exported the image file "+str(infile) + " into " + str(outfile))
 
   
 def grayim2gds_writer(infile, outfile, pixelx, pixely, cellname, level, layer=0, datatype=0 , verbose=False):
@@ -166,8 +259,8 @@ def grayim2gds_writer(infile, outfile, pixelx, pixely, cellname, level, layer=0,
     by default adds the image to (layer, datatype) = (0,0)
     
     Args:
-        :infile:    input IMAGE file (on extension that cv2 can read ), e.g. "image.png"
-        :outfile:   output GDS file, e.g. "image.gds"
+        :infile:    input IMAGE file or opened image, e.g. "image.png" or "image.npy" (see imagesource.open_image)
+        :outfile:   output GDS file, e.g. "image.gds" (or OASIS file, e.g. "image.oas")
         :pixelx:    pixel size in x, in um 
         :pixely:    pixel size in y, in um 
         :cellname:  string with cellname, e.g. "TOP"
@@ -189,70 +282,76 @@ def grayim2gds_writer(infile, outfile, pixelx, pixely, cellname, level, layer=0,
     grayim2gds_writer(infilxe, outfilxe, pixelx, pixely,cellname, graycolor, verbose=True)"""
 
 
-    img = cv2.imread(infile, cv2.IMREAD_GRAYSCALE)
+    with image_source(infile) as img:
     
-    if img is not None: 
-        print("Sucessfully imported img!")
+        if img is not None: 
+            print("Sucessfully imported img!")
         
-    h,w = img.shape 
-    print(h)
-    print(w) 
+        h,w = img.shape 
+        print(h)
+        print(w) 
     
-    nmx = w
-    nmy = h
+        nmx = w
+        nmy = h
     
-    harray = np.arange(0,h+1,nmy)
-    warray = np.arange(0,w+1,nmx)
-    #print(harray)
+        harray = np.arange(0,h+1,nmy)
+        warray = np.arange(0,w+1,nmx)
+        #print(harray)
     
-    lib = gdspy.GdsLibrary()
-    gdspy.current_library = gdspy.GdsLibrary() 
+        lib = gdspy.GdsLibrary()
+        gdspy.current_library = gdspy.GdsLibrary() 
 
-    outfilen = outfile
-    writer = gdspy.GdsWriter(outfilen,unit=1.0e-6,precision=1.0e-9)
-    cell = lib.new_cell(cellname)
+        outfilen = outfile
+        cell = lib.new_cell(cellname)
 
-    pols = []
-    
-    for hn, hi in enumerate(harray):
-        if hn == (len(harray)-1):
-            #writer.close()
-            break
-        #print(hi)
-        for hw, wi in enumerate(warray):
-            if hw == (len(warray)-1): 
-                break   
-            #print(wi)
+        pols = []
+    
+        for hn, hi in enumerate(harray):
+            if hn == (len(harray)-1):
+                #writer.close()
+                break
+            #print(hi)
+            for hw, wi in enumerate(warray):
+                if hw == (len(warray)-1): 
+                    break   
+                #print(wi)
 
-            for i in np.arange(hi,hi+nmy):
-                cell.remove_polygons(lambda pts, layer, datatype: layer == 0)
-                if verbose == True: 
-                    print(i/h)
+                for i in np.arange(hi,hi+nmy):
+                    cell.remove_polygons(lambda pts, layer, datatype: layer == 0)
+                    if verbose == True: 
+                        print(i/h)
+                    row = np.asarray(img[i])
                 
-                for j in np.arange(wi, wi+nmx):
-                    #print(j/w)
-                    #here we can also think of selectin pixels at a certain level only
-                    #and creating a GDS from a grayscale image 
-                    if img[i][j] == int(level):
-                        #rectangle takes the two  opposite corners 
-                        pols.append(gdspy.Rectangle((pixelx*j,-pixely*i),(pixelx*(j+1), -pixely*(i+1)), layer, datatype))
-
-    cell.add(pols)         
-    writer.write_cell(cell)
-    del cell 
+                    for j in np.arange(wi, wi+nmx):
+                        #print(j/w)
+                        #here we can also think of selectin pixels at a certain level only
+                        #and creating a GDS from a grayscale image 
+                        if row[j] == int(level):
+                            #rectangle takes the two  opposite corners 
+                            pols.append(gdspy.Rectangle((pixelx*j,-pixely*i),(pixelx*(j+1), -pixely*(i+1)), layer, datatype))
 
-    writer.close()
+        cell.add(pols)         
+        with gds_output(outfilen) as gdsfilen:
+            writer = gdspy.GdsWriter(gdsfilen,unit=1.0e-6,precision=1.0e-9)
+            writer.write_cell(cell)
+            writer.close()
+        del cell 
 
-    print("Exported the image file "+str(infile) + " into " + str(outfile))
+        print("Exported the image file "+str(infile) + " into " + str(outfile))
 
-def grayim2gds_writer_klops(infile,  output_filename , pixelx, pixely, cellname, level, layer=0, datatype=0 , verbose=False):
+def grayim2gds_writer_klops(infile,  output_filename , pixelx, pixely, cellname, level, layer=0, datatype=0 , verbose=False, merge=True, tile_size=256, max_points=8190, compression_level=2):
     """
     (void)  Transforms one image (converted to grayscale) into a gds, using cv2 for reading the image
     by default adds the image to (layer, datatype) = (0,0)
     
+    The pixels at the gray level are converted into run-length boxes (see raster.raster_rectangles) in tiles of 
+    tile_size x tile_size pixels, which are loaded in bulk into a single klayout pya.Region for the whole layer 
+    (see gds_klops.box_region). The merge of the boxes, the breaking of the polygons with more than max_points 
+    vertices and the writing (with the OASIS compression, see gds_klops.write_layout) are done by klayout. 
+    
     Args: 
-        :infile:            input IMAGE file (on extension that cv2 can read ), e.g. "image.png"
-        :output_filename:   intermediate GDS file
+        :infile:            input IMAGE file or opened image, e.g. "image.png" or "image.npy" (see imagesource.open_image)
+        :output_filename:   output GDS file (or OASIS file, e.g. "image.oas")
         :pixelx:            pixel size in x, in um 
         :pixely:            pixel size in y, in um 
         :cellname:          string with cellname, e.g. "TOP"
@@ -260,90 +359,46 @@ def grayim2gds_writer_klops(infile,  output_filename , pixelx, pixely, cellname,
         :layer:             (optional) gray level, defaults to 0 
         :datatype:          (optional) gds datatype, defaults to 0 
         :verbose:           (optional) defaults to False, if True prints 
+        :merge:             (optional) if True (default), merges the boxes of the whole layer into polygons
+        :tile_size:         (optional) number of pixels in each side of the tiles read from the image, defaults to 256
+        :max_points:        (optional) merged polygons with more vertices are broken, defaults to 8190 (GDS limit)
+        :compression_level: (optional) OASIS compression level (see gds_klops.write_layout), defaults to 2
 
     """
+    with image_source(infile) as img:
     
-    img = cv2.imread(infile, cv2.IMREAD_GRAYSCALE)
-    
-    if img is not None: 
-        print("Sucessfully imported img!")
+        if img is not None: 
+            print("Sucessfully imported img!")
         
-    h,w = img.shape 
-    print(h)
-    print(w) 
-    
-    nmx = w
-    nmy = h
-    
-    harray = np.arange(0,h+1,nmy)
-    warray = np.arange(0,w+1,nmx)
-    #print(harray)
-    
-    lib = gdspy.GdsLibrary()
-    gdspy.current_library = gdspy.GdsLibrary() 
-
-    #this is a gds file with single square that will be instantiated 
-    outfile="image.gds"
-    writer = gdspy.GdsWriter(outfile,unit=1.0e-6,precision=1.0e-9)
-    cell = lib.new_cell(cellname)
-    
-    i=0 
-    j=0 
-    
-    rect = gdspy.Rectangle((pixelx*j,-pixely*i),(pixelx*(j+1), -pixely*(i+1)), layer, datatype)                   
-    cell.add(rect)        
-    writer.write_cell(cell)
-    writer.close()
-    
-    print("Exported the image file "+str(infile) + " into " + str(outfile))
-    
-    #####--------------------------------
-    print("Starting making instances")
-    
-    import pya
-    
-    layout = pya.Layout()
-    
-    #input_filename = "fresnel_phase_mask_newlayers.gds"
-    cell_name = "TOP" #name of the cell for instance array cannot be the same as the input gds filename
-
-    #create cell at top 
-    top = layout.create_cell(cell_name)
-
-    #gds files to read (could also be a list)
-    gds_files = [outfile]
-
-    for file in gds_files:
-        layout.read(file) #read the files
-
-        for top_cll in layout.top_cells():
-            if (top_cll.name != cell_name): #Don't insert in the top_cell
-                cell_index = top_cll.cell_index()
-
-                for hn, hi in enumerate(harray):
-                    if hn == (len(harray)-1):
-                        break
-                    #print(hi)
-                    for hw, wi in enumerate(warray):
-                        if hw == (len(warray)-1): 
-                            break   
-                        #print(wi)
-
-                        for i in np.arange(hi,hi+nmy):
-                            if verbose == True: 
-                                print(i/h)
-                            
-                            for j in np.arange(wi, wi+nmx):
-                                #print(j/w)
-                                #here we can also think of selectin pixels at a certain level only
-                                #and creating a GDS from a grayscale image 
-                                if img[i][j] == int(level):
-                                    new_instance = pya.CellInstArray( cell_index, pya.Trans(pya.Vector(int(j*pixelx*1000),int(-i*pixely*1000))), pya.Vector(0, 0), pya.Vector(0, 0), 0, 0)
-                                    top.insert( new_instance ) #insert the cell in the array
-            else:
-                if cellname==cell_name:
-                    print("Cell names seem to be the same. Proceed with caution, the final file might not be complete.")
-                
-    #write to gds
-    layout.write(output_filename)
-    print("Done")
+        h,w = img.shape 
+        print(h)
+        print(w) 
+    
+        layout = pya.Layout()
+        layout.dbu = 0.001 #um 
+        top = layout.create_cell(cellname)
+        shapes = top.shapes(layout.layer(layer, datatype))
+    
+        tiles = list(raster.iterate_blocks((h, w), tile_size))
+        with box_region(layout.dbu) as (add_boxes, region):
+            for n, (r0, r1, c0, c1) in enumerate(tiles):
+                if verbose == True: 
+                    print(n/len(tiles))
+                values, rr0, rr1, cc0, cc1 = raster.raster_rectangles(np.asarray(img[r0:r1, c0:c1]) == int(level))
+            
+                #box corners in database units 
+                add_boxes(np.rint((c0+cc0[values])*pixelx/layout.dbu), np.rint(-(r0+rr1[values])*pixely/layout.dbu), 
+                          np.rint((c0+cc1[values])*pixelx/layout.dbu), np.rint(-(r0+rr0[values])*pixely/layout.dbu))
+    
+        if region.is_empty():
+            print("There are no pixels in this gray level! Please try another gray level.")
+            return
+    
+        if merge:
+            region.merge()
+            region.break_(max_points)
+        shapes.insert(region)
+    
+        #write to gds or oasis 
+        write_layout(layout, output_filename, compression_level)
+        print("Exported the image file "+str(infile) + " into " + str(output_filename))
@@ -0,0 +1,401 @@
+"""
+expression.py
+Module containing lazy expressions of aperture operations
+
+The functions of this module mirror the ones in generate.py (circular_aperture, fresnel_phase,
+aperture_add, ...) but instead of calculating the full aperture at each step, they record the
+operations in an ApertureExpression. Calling evaluate() calculates the whole expression in a single
+pass over tiles of rows of the aperture, so that only the output array and the temporaries of one
+tile are kept in memory.
+
+Example of use:
+    lens = expression.fresnel_phase(50*milli, 532*nano, radius=500*micro)
+    expr = lens * expression.circular_aperture(250*micro) + expression.arbitrary_aperture_function(sag.spiral, L=8)
+    aperture = expr.evaluate(generate.create_empty_aperture(-500*micro, 500*micro, 20001, -500*micro, 500*micro, 20001))
+
+"""
+
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import pyMOE.sag_functions as sag
+from pyMOE.aperture import Aperture
+
+
+class ApertureExpression:
+    """
+    Class ApertureExpression:
+        Lazy expression of an aperture, defined as a function of the coordinates of a tile
+        and of the values of the operand expressions in the same tile
+
+    Args:
+        :function:  function(XX, YY, rows, *operand_values) returning the values in the tile
+        :operands:  operand ApertureExpressions
+
+    Methods:
+        :evaluate(aperture):  calculates the expression on the grid of the aperture
+
+    """
+    def __init__(self, function, *operands):
+        self.function = function
+        self.operands = operands
+
+    def __add__(self, other):
+        return aperture_add(self, other)
+
+    def __radd__(self, other):
+        return aperture_add(other, self)
+
+    def __sub__(self, other):
+        return aperture_subtract(self, other)
+
+    def __rsub__(self, other):
+        return aperture_subtract(other, self)
+
+    def __mul__(self, other):
+        return aperture_multiply(self, other)
+
+    def __rmul__(self, other):
+        return aperture_multiply(other, self)
+
+    def nodes(self):
+        """Returns the list of unique expressions in the graph, operands first"""
+        nodes = []
+        for operand in self.operands:
+            for node in operand.nodes():
+                if all(node is not n for n in nodes):
+                    nodes.append(node)
+        nodes.append(self)
+        return nodes
+
+    def prepare(self, aperture, tile_rows, workers=None):
+        """Runs any whole aperture reduction needed before evaluating the tiles (none by default)"""
+        pass
+
+    def evaluate_tile(self, XX, YY, rows, cache):
+        """Evaluates the expression in the tile, reusing the values of shared operands in cache"""
+        key = id(self)
+        if key not in cache:
+            values = [operand.evaluate_tile(XX, YY, rows, cache) for operand in self.operands]
+            cache[key] = self.function(XX, YY, rows, *values)
+        return cache[key]
+
+    def evaluate(self, aperture, tile_rows=256, out=None, workers=None, filename=None):
+        """
+        Calculates the expression on the grid of the aperture, in a single pass over tiles of rows
+
+        Args:
+            :aperture:      aperture that defines the grid and receives the result in aperture.aperture
+            :tile_rows:     number of rows of the aperture evaluated at once
+            :out:           (optional) preallocated output array with the aperture shape (e.g. np.memmap)
+            :workers:       (optional) number of threads evaluating tiles concurrently, defaults to None (serial)
+            :filename:      (optional) .npy file where the output is allocated as a memory-mapped array, if out is not given
+
+        Returns:
+            :aperture:      aperture with the result of the expression
+        """
+        assert type(aperture) is Aperture, "aperture must be of type Aperture"
+        assert tile_rows >= 1, "tile_rows must be a positive integer"
+
+        nodes = self.nodes()
+        for node in nodes:
+            node.prepare(aperture, tile_rows, workers)
+
+        def evaluate_rows(tile):
+            r0, r1, XX, YY = tile
+            return r0, r1, self.evaluate_tile(XX, YY, slice(r0, r1), {})
+
+        start = 0
+        if out is None:
+            # the first tile gives the type of the output, and is stored instead of evaluated again
+            r0, r1, value = evaluate_rows(next(iterate_tiles(aperture, tile_rows)))
+            if filename is None:
+                out = np.zeros(aperture.grid_shape, dtype=np.result_type(value))
+            else:
+                out = np.lib.format.open_memmap(filename, mode='w+', dtype=np.result_type(value), shape=aperture.grid_shape)
+            out[r0:r1] = value
+            start = r1
+
+        def store_rows(tile):
+            r0, r1, value = evaluate_rows(tile)
+            out[r0:r1] = value
+
+        for _ in map_tiles(store_rows, aperture, tile_rows, workers, start=start):
+            pass
+
+        aperture.aperture = out
+        return aperture
+
+
+def iterate_tiles(aperture, tile_rows, start=0):
+    """
+    Iterates over the tiles of rows of the aperture grid
+
+    Args:
+        :aperture:      aperture that defines the grid
+        :tile_rows:     number of rows in each tile
+        :start:         (optional) first row of the first tile, defaults to 0
+
+    Returns:
+        generator of (r0, r1, XX, YY) with the first and last+1 rows of the tile and its coordinates
+    """
+    x = np.asarray(aperture.x)
+    y = np.asarray(aperture.y)
+    N_y, N_x = aperture.grid_shape
+    for r0 in range(start, N_y, tile_rows):
+        r1 = min(r0+tile_rows, N_y)
+        XX = np.broadcast_to(x[None, :], (r1-r0, N_x))
+        YY = np.broadcast_to(y[r0:r1, None], (r1-r0, N_x))
+        yield r0, r1, XX, YY
+
+
+def map_tiles(function, aperture, tile_rows, workers=None, start=0):
+    """
+    Maps function over the tiles of iterate_tiles, in a pool of threads if workers is given 
+    (numpy releases the GIL in most array operations). Results are returned in the order of the tiles.
+
+    Args:
+        :function:      function of the tile (r0, r1, XX, YY)
+        :aperture:      aperture that defines the grid
+        :tile_rows:     number of rows in each tile
+        :workers:       number of threads, defaults to None (serial)
+        :start:         (optional) first row of the first tile, defaults to 0
+    """
+    if workers is None:
+        return list(map(function, iterate_tiles(aperture, tile_rows, start)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, iterate_tiles(aperture, tile_rows, start)))
+
+
+class SagExpression(ApertureExpression):
+    """
+    Class SagExpression:
+        Lazy expression of a sag function (see sag_functions) evaluated at the coordinates relative to center.
+        Sag functions taking an offset argument subtract the minimum of their output over the whole aperture
+        (e.g. sag_functions.fresnel_lens_phase). If not given, the offset is calculated in a first pass over
+        the tiles, which gives the same result as evaluating the function on the whole grid.
+
+    Args:
+        :sag_function:      sag function(XX, YY, **function_args)
+        :center:            center of the function (x0, y0)
+        :function_args:     dictionary of arguments of the sag function
+    """
+    def __init__(self, sag_function, center, function_args):
+        assert callable(sag_function), "provided function must be callable"
+        super().__init__(self._evaluate)
+        self.sag_function = sag_function
+        self.center = center
+        self.function_args = function_args
+        self.needs_offset = ("offset" in inspect.signature(sag_function).parameters) and ("offset" not in function_args)
+        self.offset = None
+
+    def _evaluate(self, XX, YY, rows, offset=None):
+        x0, y0 = self.center
+        function_args = dict(self.function_args)
+        if self.needs_offset:
+            function_args["offset"] = self.offset if offset is None else offset
+        return self.sag_function(XX-x0, YY-y0, **function_args)
+
+    def prepare(self, aperture, tile_rows, workers=None):
+        if not self.needs_offset:
+            return
+        def tile_min(tile):
+            r0, r1, XX, YY = tile
+            return np.min(self._evaluate(XX, YY, slice(r0, r1), offset=0))
+        self.offset = min(map_tiles(tile_min, aperture, tile_rows, workers))
+
+
+def as_expression(value):
+    """
+    Returns value as an ApertureExpression. Accepts expressions, apertures (whose values are read
+    in each tile) and scalars.
+    """
+    if isinstance(value, ApertureExpression):
+        return value
+    if type(value) is Aperture:
+        return from_aperture(value)
+    assert np.isscalar(value), "value must be an ApertureExpression, Aperture or scalar"
+    return ApertureExpression(lambda XX, YY, rows: value)
+
+
+class ApertureValues(ApertureExpression):
+    """
+    Class ApertureValues:
+        Expression with the values of an existing aperture, read in each tile.
+        The aperture must have the grid where the expression is evaluated.
+
+    Args:
+        :aperture:  aperture of type Aperture
+    """
+    def __init__(self, aperture):
+        assert type(aperture) is Aperture, "aperture must be of type Aperture"
+        super().__init__(lambda XX, YY, rows: aperture.aperture[rows])
+        self.aperture = aperture
+
+    def prepare(self, aperture, tile_rows, workers=None):
+        assert aperture.grid == self.aperture.grid, "Spatial dimensions of the aperture and the evaluation grid must be the same"
+
+
+def from_aperture(aperture):
+    """
+    Expression with the values of an existing aperture (see ApertureValues)
+
+    Args:
+        :aperture:  aperture of type Aperture
+    """
+    return ApertureValues(aperture)
+
+
+def circular_aperture(radius, center=(0,0)):
+    """
+    Expression of a 2D circular aperture mask (see generate.circular_aperture)
+
+    Args:
+        :radius:    radius of the circle aperture
+        :center:    default (x0=0, y0=0) center of circle
+    """
+    assert radius is not None
+    x0, y0 = center
+
+    def function(XX, YY, rows):
+        maskcir = np.zeros(XX.shape)
+        rc = np.sqrt((XX-x0)**2 + (YY-y0)**2)
+        maskcir[rc<radius] = 1
+        return maskcir
+
+    return ApertureExpression(function)
+
+
+class RectangleExpression(ApertureExpression):
+    """
+    Class RectangleExpression:
+        Lazy expression of a 2D rectangular aperture mask (see generate.rectangular_aperture). Without corner
+        and center, the rectangle is centered on the grid where the expression is evaluated.
+
+    Args:
+        :width, height:     width and height of the rectangle
+        :corner:            if given, sets the lower left corner of the rectangle
+        :center:            if given, sets the center of the rectangle
+    """
+    def __init__(self, width, height, corner=None, center=None):
+        if corner is not None:
+            assert (type(corner)==tuple) and (len(corner) == 2)
+        if center is not None:
+            assert (type(center)==tuple) and (len(center) == 2)
+        super().__init__(self._evaluate)
+        self.width = width
+        self.height = height
+        self.corner = corner
+        self.center = center
+        self.x0, self.y0 = None, None
+
+    def _evaluate(self, XX, YY, rows):
+        mask = np.zeros(XX.shape)
+        mask[(XX>=self.x0)&(XX<=self.x0+self.width)&(YY>=self.y0)&(YY<=self.y0+self.height)] = 1
+        return mask
+
+    def prepare(self, aperture, tile_rows, workers=None):
+        if self.center is not None:
+            xc, yc = self.center
+        elif self.corner is not None:
+            self.x0, self.y0 = self.corner
+            return
+        else:
+            xc, yc = np.mean(aperture.x), np.mean(aperture.y)
+        self.x0, self.y0 = xc-self.width/2, yc-self.height/2
+
+
+def rectangular_aperture(width, height, corner=None, center=None):
+    """
+    Expression of a 2D rectangular aperture mask (see generate.rectangular_aperture and RectangleExpression)
+
+    Args:
+        :width, height:     width and height of the rectangle
+        :corner:            if given, sets the lower left corner of the rectangle
+        :center:            if given, sets the center of the rectangle, defaults to the center of the grid
+    """
+    return RectangleExpression(width, height, corner, center)
+
+
+def arbitrary_aperture_function(function, center=(0,0), **function_args):
+    """
+    Expression of the given sag function (see generate.arbitrary_aperture_function)
+
+    Args:
+        :function:          function to calculate the phase on
+        :center:            default (x0=0, y0=0) center of the function
+        :**function_args:   additional arguments to pass onto the function
+    """
+    return SagExpression(function, center, function_args)
+
+
+def truncate_aperture_radius(expression, radius, center=(0,0), truncate_value=0):
+    """
+    Expression truncated to inside the circle of radius at center (see generate.truncate_aperture_radius)
+
+    Args:
+        :expression:        expression to be truncated
+        :radius:            radius to select the region
+        :center:            center points tuple of the circle
+        :truncate_value:    value to truncate the mask, by default 0
+    """
+    x0, y0 = center
+
+    def function(XX, YY, rows, value):
+        rc = np.sqrt((XX-x0)**2 + (YY-y0)**2)
+        return np.where(rc>radius, truncate_value, value)
+
+    return ApertureExpression(function, as_expression(expression))
+
+
+def fresnel_phase(focal_length, wavelength, radius=None, center=(0,0)):
+    """
+    Expression of the Fresnel phase mask (see generate.fresnel_phase)
+
+    Args:
+        :focal_length:      design focal length
+        :wavelength:        design wavelength
+        :radius:            if defined, truncates the fresnel phase to inside this radius
+        :center:            default (x0=0, y0=0) center of the lens
+    """
+    assert focal_length is not None
+    assert wavelength is not None
+
+    expression = arbitrary_aperture_function(sag.fresnel_lens_phase, center=center, focal_length=focal_length, wavelength=wavelength)
+
+    if radius is not None:
+        expression = truncate_aperture_radius(expression, radius, center=center)
+
+    return expression
+
+
+def aperture_operation(expression1, expression2, operand):
+    """
+    Expression of the operation between expressions (or apertures or scalars) 1 and 2
+
+    Args:
+        :expression1:   First expression
+        :expression2:   Second expression
+        :operand:       numpy operand function to consider
+    """
+    assert type(operand) == np.ufunc, "operand must be a numpy function"
+
+    return ApertureExpression(lambda XX, YY, rows, value1, value2: operand(value1, value2),
+                              as_expression(expression1), as_expression(expression2))
+
+
+def aperture_add(expression1, expression2):
+    """Adds two expressions"""
+    return aperture_operation(expression1, expression2, np.add)
+
+
+def aperture_subtract(expression1, expression2):
+    """Subtracts two expressions"""
+    return aperture_operation(expression1, expression2, np.subtract)
+
+
+def aperture_multiply(expression1, expression2):
+    """Multiply two expressions"""
+    return aperture_operation(expression1, expression2, np.multiply)
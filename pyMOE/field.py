@@ -11,6 +11,7 @@ import numpy as np
 
 
 from pyMOE.aperture import Aperture
+from pyMOE.aperture import grid_descriptor
 
 
 
@@ -28,20 +29,36 @@ class Field:
     Methods:
         :field:     returns the field
         :shape:     returns the shape of the field
+        :grid:      returns the Grid descriptor (origin, pitch, shape) of the field
 
     """
     def __init__(self, x, y):
         self.x = x
         self.y = y
-        self.XX, self.YY = np.meshgrid(x, y) # indexing='ij')
         self.pixel_x = self.x[1]-self.x[0]
         self.pixel_y = self.y[1]-self.y[0]
     
-        self.field = np.zeros(self.XX.shape, dtype=complex)
+        self.field = np.zeros(self.grid_shape, dtype=complex)
     @property
     def shape(self):
         return self.field.shape
     @property
+    def grid_shape(self):
+        """Shape of the (y, x) grid of the field, same as np.meshgrid(x, y)"""
+        return (len(self.y), len(self.x))
+    @property
+    def grid(self):
+        """Hashable Grid descriptor (origin, pitch, shape) of the field"""
+        return grid_descriptor(self.x, self.y)
+    @property
+    def XX(self):
+        """x coordinates of the grid, as a read-only broadcasted view of the x axis"""
+        return np.broadcast_to(np.asarray(self.x)[None, :], self.grid_shape)
+    @property
+    def YY(self):
+        """y coordinates of the grid, as a read-only broadcasted view of the y axis"""
+        return np.broadcast_to(np.asarray(self.y)[:, None], self.grid_shape)
+    @property
     def amplitude(self):
         return np.abs(self.field)
     @property
@@ -118,16 +135,16 @@ def modulate_field(field, amplitude_mask=None, phase_mask=None):
     assert type(field) is Field, "field must be of type Field"
 
 
-    modulation_amplitude = np.ones(field.XX.shape)
-    modulation_phase = np.zeros(field.XX.shape)
+    modulation_amplitude = np.ones(field.grid_shape)
+    modulation_phase = np.zeros(field.grid_shape)
 
     if amplitude_mask is not None:
         assert type(amplitude_mask) is Aperture, "amplitude_mask must be of type Aperture"
-        assert np.all(amplitude_mask.XX == field.XX) and np.all(amplitude_mask.YY == field.YY), "Spatial dimensions of field and amplitude_mask must be the same"
+        assert amplitude_mask.grid == field.grid, "Spatial dimensions of field and amplitude_mask must be the same"
         modulation_amplitude = amplitude_mask.aperture
     if phase_mask is not None:
         assert type(phase_mask) is Aperture, "phase_mask must be of type Aperture"
-        assert np.all(phase_mask.XX == field.XX) and np.all(phase_mask.YY == field.YY), "Spatial dimensions of field and phase_mask must be the same"
+        assert phase_mask.grid == field.grid, "Spatial dimensions of field and phase_mask must be the same"
         modulation_phase = phase_mask.aperture
 
     # Creates a new empty field to store the modulated field
@@ -155,7 +172,7 @@ def generate_uniform_field(field, E0=1 ):
     """
     assert type(field) is Field, "field must be of type Field"
 
-    field.field = np.ones(field.XX.shape)*E0
+    field.field = np.ones(field.grid_shape)*E0
     
 
     return field
@@ -199,28 +216,55 @@ class Screen:
         Creates a Screen object that is 1D or 2D and has internal xyz coordinates
          to facilitate the propagation of a field onto a target screen
           
-        
+        The coordinates are stored as the 1D x, y, z axes and XX, YY, ZZ are broadcasted 
+        views of these axes. If a filename is given, the screen data is stored on disk as a 
+        np.memmap with each z plane contiguous, so that volumes larger than RAM can be 
+        written plane by plane (screen.screen[:,:,z_i]).
         
     Args:
         :x:         Vector for the x axis
         :y:         Vector for the y axis
         :z:         Vector for the z axis
+        :filename:  (optional) file to store the screen data as a memory-mapped array, defaults to None (in memory)
     
     Methods:
         :screen:  returns the field on the screen
         :shape:     returns the shape of the field
+        :flush:     writes the memory-mapped data to disk
 
     """
-    def __init__(self, x, y, z):
+    def __init__(self, x, y, z, filename=None):
         self.x = x
         self.y = y
         self.z = z
-        self.XX, self.YY, self.ZZ = np.meshgrid(x, y, z)#, indexing='ij')
         # self.pixel_x = self.x[1]-self.x[0]
         # self.pixel_y = self.y[1]-self.y[0]
         # self.pixel_z = self.z[1]-self.z[0]
-    
-        self.screen = np.zeros(self.XX.shape, dtype=complex)
+        self.filename = filename
+
+        N_y, N_x, N_z = len(np.atleast_1d(y)), len(np.atleast_1d(x)), len(np.atleast_1d(z))
+        if filename is None:
+            self.screen = np.zeros((N_y, N_x, N_z), dtype=complex)
+        else:
+            # planes are stored contiguous on disk and the view keeps the (y, x, z) indexing
+            data = np.memmap(filename, dtype=complex, mode='w+', shape=(N_z, N_y, N_x))
+            self.screen = data.transpose(1, 2, 0)
+
+    @property
+    def XX(self):
+        return np.broadcast_to(np.atleast_1d(self.x)[None, :, None], self.shape)
+    @property
+    def YY(self):
+        return np.broadcast_to(np.atleast_1d(self.y)[:, None, None], self.shape)
+    @property
+    def ZZ(self):
+        return np.broadcast_to(np.atleast_1d(self.z)[None, None, :], self.shape)
+
+    def flush(self):
+        """Writes the screen data to disk, if memory-mapped"""
+        if isinstance(self.screen, np.memmap):
+            self.screen.flush()
+
     @property
     def shape(self):
         return self.screen.shape
@@ -237,7 +281,7 @@ class Screen:
 
     
     
-def create_screen_XY(xmin, xmax, N_x, ymin, ymax, N_y, z):
+def create_screen_XY(xmin, xmax, N_x, ymin, ymax, N_y, z, filename=None):
     """
     Creates an empty screen of the mesh dimensions provided
     
@@ -247,6 +291,7 @@ def create_screen_XY(xmin, xmax, N_x, ymin, ymax, N_y, z):
         :ymin, ymax:    range for y 
         :N_y:           number of y points
         :z:             z position of the screen plane
+        :filename:      (optional) file to store the screen as a memory-mapped array 
     
     Returns:
         :screen: empty Screen
@@ -255,7 +300,30 @@ def create_screen_XY(xmin, xmax, N_x, ymin, ymax, N_y, z):
     y = np.linspace(ymin, ymax, N_y)
     z=z
     
-    return Screen(x,y,z)
+    return Screen(x,y,z, filename=filename)
+
+
+def create_screen_XYZ(xmin, xmax, N_x, ymin, ymax, N_y, zmin, zmax, N_z, filename=None):
+    """
+    Creates an empty volume screen of the mesh dimensions provided
+    
+    Args: 
+        :xmin, xmax:    range for x 
+        :N_x:           number of x points
+        :ymin, ymax:    range for y 
+        :N_y:           number of y points
+        :zmin, zmax:    range for z
+        :N_z:           number of z points
+        :filename:      (optional) file to store the screen as a memory-mapped array 
+    
+    Returns:
+        :screen: empty Screen
+    """
+    x = np.linspace(xmin, xmax, N_x)
+    y = np.linspace(ymin, ymax, N_y)
+    z = np.linspace(zmin, zmax, N_z)
+    
+    return Screen(x,y,z, filename=filename)
 
 
 
@@ -13,6 +13,11 @@ Functions using gdspy and/or pya are exemplified within the notebooks.
 """
 
 
+import os
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
 import pya 
 
 
@@ -103,7 +108,134 @@ def gds_to_dxf(inputfilename_gds, outputfilename_dxf):
     layout=pya.Layout()
     layout.read(inputfilename_gds)
     layout.write(outputfilename_dxf) 
+
+######WRITE .OAS FILES 
+OASIS_EXTENSIONS = (".oas", ".oasis")
+
+def is_oasis(filename):
+    """
+    returns True if the filename has an OASIS extension (.oas or .oasis) 
+    """
+    return str(filename).lower().endswith(OASIS_EXTENSIONS)
+
+def write_layout(layout, filename, compression_level=2, cblocks=True):
+    """
+    (void) writes the pya layout to file, in OASIS format if the filename has an OASIS extension (see is_oasis) 
+    
+    Args:
+        :layout:            pya.Layout to write 
+        :filename:          string filename of the output file 
+        :compression_level: OASIS compression level (0 to 10). Levels above 0 detect regular arrays of identical 
+                            shapes and write them as OASIS repetitions, higher levels search harder
+        :cblocks:           if True (default), compresses the OASIS records with CBLOCKs (deflate)
+    """
+    options = pya.SaveLayoutOptions()
+    if is_oasis(filename):
+        options.format = "OASIS"
+        options.oasis_compression_level = compression_level
+        options.oasis_write_cblocks = cblocks
+    else: 
+        options.set_format_from_filename(filename)
+    layout.write(filename, options)
+
+def gds_to_oasis(inputfilename_gds, outputfilename_oas, compression_level=2, cblocks=True):
+    """
+    (void) converts gds file into OASIS file (see write_layout for the compression options) 
+    """
+    layout=pya.Layout()
+    layout.read(inputfilename_gds)
+    write_layout(layout, outputfilename_oas, compression_level=compression_level, cblocks=cblocks)
+
+@contextmanager
+def gds_output(filename, compression_level=2, cblocks=True):
+    """
+    Context manager giving the name of the gds file to be written by gds-only writers (e.g. gdspy.GdsWriter). 
+    If filename has an OASIS extension, the gds is written to a temporary file which is converted to 
+    OASIS when leaving the context (see gds_to_oasis). Otherwise it is filename itself.  
     
+    Example of use: 
+        with gds_output("mask.oas") as gdsfile: 
+            lib.write_gds(gdsfile)
+    """
+    if not is_oasis(filename):
+        yield filename
+        return
+    
+    with tempfile.TemporaryDirectory() as tempdir: 
+        gdsfile = os.path.join(tempdir, "layout.gds")
+        yield gdsfile
+        gds_to_oasis(gdsfile, filename, compression_level=compression_level, cblocks=cblocks)
+
+
+def _gds_record(record_type, data=b""):
+    """Returns the bytes of a gds record with record_type (record and data type, e.g. 0x0206) and data"""
+    return (4 + len(data)).to_bytes(2, "big") + record_type.to_bytes(2, "big") + data
+
+
+def _gds_real(value):
+    """Returns the 8-byte gds real (excess-64, base 16 exponent) of a positive value"""
+    exponent = 64
+    while value >= 1:
+        value, exponent = value/16, exponent+1
+    while value < 1/16:
+        value, exponent = value*16, exponent-1
+    return exponent.to_bytes(1, "big") + int(round(value*2**56)).to_bytes(7, "big")
+
+
+#gds records of one box: BOUNDARY, LAYER, DATATYPE, XY (5 points) and ENDEL, all big-endian
+_GDS_BOX = np.dtype([("boundary", ">u2", 2), ("layer", ">u2", 2), ("layer_nr", ">i2"),
+                     ("datatype", ">u2", 2), ("datatype_nr", ">i2"), ("xy", ">u2", 2), ("points", ">i4", 10),
+                     ("endel", ">u2", 2)])
+
+
+@contextmanager
+def box_region(dbu=0.001, filename=None):
+    """
+    Context manager to load a large number of boxes into a pya.Region in bulk. The boxes, given as
+    arrays of corners in database units, are streamed as gds records (in cell BOXES, layer 0) to a
+    temporary file, which is read by klayout into the region when leaving the context.
+
+    Example of use:
+        with box_region() as (add_boxes, region):
+            add_boxes(left, bottom, right, top)
+        region.merge()
+
+    Args:
+        :dbu:       database unit of the boxes, in um, defaults to 0.001
+        :filename:  (optional) gds file of the boxes, which is kept. Defaults to None (temporary file)
+    """
+    region = pya.Region()
+    with tempfile.TemporaryDirectory() as tempdir:
+        gdsfile = os.path.join(tempdir, "boxes.gds") if filename is None else filename
+        with open(gdsfile, "wb") as f:
+            f.write(_gds_record(0x0002, (600).to_bytes(2, "big")))
+            f.write(_gds_record(0x0102, bytes(24)))
+            f.write(_gds_record(0x0206, b"BOXES\0"))
+            #database unit in user units (um) and in meters
+            f.write(_gds_record(0x0305, _gds_real(dbu) + _gds_real(dbu*1e-6)))
+            f.write(_gds_record(0x0502, bytes(24)))
+            f.write(_gds_record(0x0606, b"BOXES\0"))
+
+            def add_boxes(left, bottom, right, top):
+                records = np.zeros(len(left), dtype=_GDS_BOX)
+                records["boundary"] = (4, 0x0800)
+                records["layer"] = (6, 0x0D02)
+                records["datatype"] = (6, 0x0E02)
+                records["xy"] = (44, 0x1003)
+                records["endel"] = (4, 0x1100)
+                records["points"] = np.stack([left, bottom, right, bottom, right, top, left, top, left, bottom], axis=-1)
+                f.write(records.tobytes())
+
+            yield add_boxes, region
+
+            f.write(_gds_record(0x0700))
+            f.write(_gds_record(0x0400))
+
+        layout = pya.Layout()
+        layout.read(gdsfile)
+        region.insert(layout.top_cell().begin_shapes_rec(layout.layer(0, 0)))
+
+
 def correct_gds(inputfilename_gds, outputfilename_dxf): 
     """
     (void) corrects gds to be able to read/write gds files 
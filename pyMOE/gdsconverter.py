@@ -3,11 +3,19 @@ gdsconverter.py
 GDS converter module
 
 """
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import hashlib
+from multiprocessing import shared_memory
+import warnings
+
 import gdspy
 import numpy as np
 
 from pyMOE.aperture import Aperture
 from pyMOE.utils import progress_bar, Timer
+from pyMOE.gds_klops import gds_output
+import pyMOE.raster as raster
 
 import matplotlib.pyplot as plt 
 
@@ -26,6 +34,44 @@ def count_vertices(pols):
         sum += p.shape[0]
     return sum
 
+def gds_boundary_bytes(vertices):
+    """ Size in bytes of a GDSII BOUNDARY element with the number of vertices
+    (BOUNDARY, LAYER, DATATYPE, XY with the closing point and ENDEL records)
+    
+    Args: 
+        :vertices: number of vertices of the polygon
+    """
+    return 32 + 8*vertices
+
+
+def layout_statistics(cells):
+    """
+    Statistics of each layer of the polygons in cells, including the cells they reference
+    
+    Args:
+        :cells:     list of gdspy cells
+    
+    Returns:
+        dictionary {layer: {"polygons", "vertices", "bytes", "bbox"}} with the number of polygons and vertices, 
+        the estimated size of the polygons in a gds file (see gds_boundary_bytes) and the bounding box [[xmin, ymin], [xmax, ymax]]
+    """
+    statistics = {}
+    for cell in cells:
+        for (layer, datatype), polygons in cell.get_polygons(by_spec=True).items():
+            if len(polygons) == 0:
+                continue
+            vertices = np.array([len(p) for p in polygons])
+            points = np.concatenate(polygons)
+            bbox = np.array([points.min(axis=0), points.max(axis=0)])
+            
+            layer_statistics = statistics.setdefault(layer, {"polygons": 0, "vertices": 0, "bytes": 0, "bbox": bbox})
+            layer_statistics["polygons"] += len(polygons)
+            layer_statistics["vertices"] += int(vertices.sum())
+            layer_statistics["bytes"] += int(gds_boundary_bytes(vertices).sum())
+            layer_statistics["bbox"] = np.array([np.minimum(layer_statistics["bbox"][0], bbox[0]), np.maximum(layer_statistics["bbox"][1], bbox[1])])
+    return statistics
+
+
 def merge_polygons(polygons, layer=0, assume_non_overlap=True, break_vertices=250, verbose=True, ):
     """
     Merge polygons function receives a list of polygons or polygon set and 
@@ -80,6 +126,50 @@ def merge_polygons(polygons, layer=0, assume_non_overlap=True, break_vertices=25
     progress_bar(1)
     
     return list_polygonsets
+
+
+def outline_polygons(mask, x, y, layer=0, datatype=0, max_points=8190, verbose=True, contour=False):
+    """
+    Fully merged polygons of the True pixels of mask. Instead of boolean operations between pixel
+    polygons (see merge_polygons), the 4-connected regions of the mask are labeled and their outlines
+    are traced along the pixel edges in a single pass, in time linear with the number of pixels.
+    Only the regions with holes go through a gdspy.boolean operation, to subtract the holes.
+    
+    Args:
+        :mask:          2D boolean array of the pixels to include
+        :x:             Vector for the x axis of the pixel centers
+        :y:             Vector for the y axis of the pixel centers
+        :layer:         layer of the polygons
+        :datatype:      datatype of the polygons
+        :max_points:    default 8190. Polygons with more vertices are fractured (GDSII limit)
+        :verbose:       default True. Prints the progress bar.
+        :contour:       default False. If True, uses the marching squares contours of the regions (see raster.trace_contours)
+        
+    Returns:
+        list of polygons or polygonsets.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    components = raster.component_outlines(mask, contour=contour)
+    total_components = len(components)
+    
+    polygons = []
+    for i, (outer, holes) in enumerate(components):
+        outer = raster.corner_coordinates(outer, x, y)
+        if holes:
+            holes = gdspy.PolygonSet([raster.corner_coordinates(hole, x, y) for hole in holes])
+            polygon = gdspy.boolean(gdspy.Polygon(outer), holes, "not", max_points=max_points, layer=layer, datatype=datatype)
+        else:
+            polygon = gdspy.Polygon(outer, layer, datatype)
+            if len(outer) > max_points:
+                polygon = polygon.fracture(max_points=max_points)
+        polygons.append(polygon)
+        if verbose and (i % 1000 == 0):
+            progress_bar(i/total_components)
+    if verbose:
+        progress_bar(1)
+    
+    return polygons
     
 ##############################################################################################################################
 
@@ -154,6 +244,106 @@ def cell_wpol_gdspy(cs, cellname, prec=1e-6, mpoints=1e9):
                
     return lib, cell 
     
+def contour_polygons(mask, x, y, layer=0, datatype=0, tile_size=None, max_points=8190, verbose=True):
+    """
+    Polygons of the marching squares contours of the True pixels of mask, with holes (see outline_polygons). 
+    If tile_size is given, the mask is traced in tiles with a halo of one pixel and the contours are clipped 
+    to each tile, so that the tracing only holds one tile in memory.
+    
+    Args:
+        :mask:          2D boolean array of the pixels to include
+        :x:             Vector for the x axis of the pixel centers
+        :y:             Vector for the y axis of the pixel centers
+        :layer:         layer of the polygons
+        :datatype:      datatype of the polygons
+        :tile_size:     (optional) number of pixels in each side of the tiles, defaults to None (no tiling)
+        :max_points:    default 8190. Polygons with more vertices are fractured (GDSII limit)
+        :verbose:       default True. Prints the progress bar.
+        
+    Returns:
+        list of polygons or polygonsets.
+    """
+    if tile_size is None:
+        return outline_polygons(mask, x, y, layer, datatype, max_points, verbose, contour=True)
+    
+    x = np.asarray(x)
+    y = np.asarray(y)
+    pixel_x = x[1]-x[0]
+    pixel_y = y[1]-y[0]
+    h, w = mask.shape
+    tiles = list(raster.iterate_blocks(mask.shape, tile_size))
+    
+    polygons = []
+    for i, (r0, r1, c0, c1) in enumerate(tiles):
+        # tile with a halo of one pixel, which is empty outside the mask
+        block = np.zeros((r1-r0+2, c1-c0+2), dtype=bool)
+        a0, a1, b0, b1 = max(r0-1, 0), min(r1+1, h), max(c0-1, 0), min(c1+1, w)
+        block[a0-r0+1:a1-r0+1, b0-c0+1:b1-c0+1] = mask[a0:a1, b0:b1]
+        if not block.any():
+            continue
+        
+        x_block = x[0] + np.arange(c0-1, c1+1)*pixel_x
+        y_block = y[0] + np.arange(r0-1, r1+1)*pixel_y
+        block_polygons = outline_polygons(block, x_block, y_block, layer, datatype, max_points, verbose=False, contour=True)
+        tile_rectangle = gdspy.Rectangle((x[0]+(c0-0.5)*pixel_x, y[0]+(r0-0.5)*pixel_y), (x[0]+(c1-0.5)*pixel_x, y[0]+(r1-0.5)*pixel_y))
+        clipped = gdspy.boolean(block_polygons, tile_rectangle, "and", max_points=max_points, layer=layer, datatype=datatype)
+        if clipped is not None:
+            polygons.append(clipped)
+        if verbose:
+            progress_bar((i+1)/len(tiles))
+    
+    return polygons
+
+
+def layer_polygons(mask, x, y, merge=False, merge_method="boolean", break_vertices=250, verbose=False):
+    """
+    Converts the True pixels of mask into polygons: run-length rectangles (see raster.raster_rectangles),
+    optionally merged with merge_polygons (merge_method "boolean") or replaced by the outlines of the
+    connected regions (merge_method "outline", see outline_polygons).
+    The polygons are returned as plain arrays so that layers can be converted in separate processes.
+    
+    Args:
+        :mask:              2D boolean array of the pixels to include
+        :x:                 Vector for the x axis of the pixel centers
+        :y:                 Vector for the y axis of the pixel centers
+        :merge:             default False. If True, will merge the pixel rectangles
+        :merge_method:      default "boolean". Can also accept "outline"
+        :break_vertices:    threshold value to speed up the merging of polygons with merge_polygons
+        :verbose:           default False. Prints the progress bar.
+        
+    Returns:
+        list of (n, 2) arrays with the vertices of the polygons
+    """
+    if merge and (merge_method == "outline"):
+        polygons = outline_polygons(mask, x, y, verbose=verbose)
+    else:
+        values, r0, r1, c0, c1 = raster.raster_rectangles(mask)
+        r0, r1, c0, c1 = r0[values], r1[values], c0[values], c1[values]
+        rectangles = raster.rectangle_polygons(*raster.rectangle_corners(x, y, r0, r1, c0, c1))
+        if not merge:
+            return list(rectangles)
+        if len(rectangles) == 0:
+            return []
+        polygons = merge_polygons([gdspy.Polygon(rect) for rect in rectangles], break_vertices=break_vertices, verbose=verbose)
+    
+    return [points for polygon in polygons for points in polygon.polygons]
+
+
+# discretized aperture shared with the worker processes of GDSMask._create_layout_raster
+_shared_aperture = None
+
+
+def _attach_shared_aperture(name, shape, dtype):
+    """Pool initializer: attaches the worker to the discretized aperture in shared memory"""
+    global _shared_aperture
+    memory = shared_memory.SharedMemory(name=name)
+    _shared_aperture = (memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf))
+
+
+def _shared_layer_polygons(layer, **layer_args):
+    """Polygons of one level of the shared discretized aperture (see layer_polygons)"""
+    return layer_polygons(_shared_aperture[1] == layer, **layer_args)
+
 ################################################################################################################################3
 
 class GDSMask():
@@ -171,12 +361,18 @@ class GDSMask():
         :cells:             list of cells in layout
         :total_polygons:    total number of polygons in layout in all layers
         :total_vertices:    total number of vertices in all polygons in all layers
+        :total_bytes:       estimated size of the polygons in the gds file
+        :statistics:        dictionary with the polygons, vertices, bytes and bounding box of each layer
+
+        :estimate_statistics(): estimates the statistics from the discretized aperture, before creating the layout
 
         :create_layout():   Creates layout (raster or vector or edges etc todo)
         :merge(layer):      merges polygons in layer
         :plot():            plots mask
         :viewer():          Opens LayoutViewer of gdspy
         :save_gds(filename): saves layout to gds file
+        :write_gds_tiled(filename): converts and writes the layout to gds file tile by tile
+        :write_oasis(filename): saves layout to OASIS file
 
     """
     def __init__(self, mask, units=1e-6, precision=1e-9, verbose=True):
@@ -188,6 +384,7 @@ class GDSMask():
         self.verbose=verbose
         self._gdslib_init_error = "Error: gdsmask not created yet. Run GDSMask.create_layout()"
         self.layers = None
+        self._statistics = None
     
     @property
     def levels(self):
@@ -203,12 +400,66 @@ class GDSMask():
         
     
     @property
-    def total_polygons(self):
+    def statistics(self):
+        """Statistics of each layer of the layout (see layout_statistics), calculated once after create_layout()"""
         assert self.gdslib is not None, "%s"%self._gdslib_init_error
+        if self._statistics is None:
+            self._statistics = layout_statistics(self.gdslib.top_level())
+        return self._statistics
+    
+    @property
+    def total_polygons(self):
+        return sum(layer["polygons"] for layer in self.statistics.values())
         
     @property
     def total_vertices(self):
-        assert self.gdslib is not None, "%s"%self._gdslib_init_error
+        return sum(layer["vertices"] for layer in self.statistics.values())
+    
+    @property
+    def total_bytes(self):
+        return sum(layer["bytes"] for layer in self.statistics.values())
+    
+    def estimate_statistics(self, tile_rows=None):
+        """
+        Estimates the statistics of the raster layout (see layout_statistics) from the discretized aperture, 
+        without creating any polygon. The polygons are the run-length rectangles of raster mode without merging 
+        (see raster.raster_rectangles), which are an upper bound for the merged layouts.
+        
+        Args:
+            :tile_rows:     (optional) number of rows of the aperture processed at once, to bound the memory 
+                            used with large (e.g. memory mapped) apertures. Rectangles are not merged across 
+                            tiles, so the estimate can be slightly above the untiled one.
+        
+        Returns:
+            dictionary with the polygons, vertices, bytes and bounding box of each layer
+        """
+        h, w = self.aperture.shape
+        tile_rows = h if tile_rows is None else tile_rows
+        x = np.asarray(self.mask.x)/self.units
+        y = np.asarray(self.mask.y)/self.units
+        
+        counts = np.zeros(len(self.levels), dtype=np.int64)
+        row_min = np.full(len(self.levels), h)
+        row_max = np.full(len(self.levels), -1)
+        col_min = np.full(len(self.levels), w)
+        col_max = np.full(len(self.levels), -1)
+        for r0 in range(0, h, tile_rows):
+            values, t0, t1, c0, c1 = raster.raster_rectangles(np.rint(self.aperture[r0:r0+tile_rows]))
+            values = values.astype(int)
+            counts += np.bincount(values, minlength=len(self.levels))
+            np.minimum.at(row_min, values, r0+t0)
+            np.maximum.at(row_max, values, r0+t1)
+            np.minimum.at(col_min, values, c0)
+            np.maximum.at(col_max, values, c1)
+        
+        statistics = {}
+        for layer in np.flatnonzero(counts):
+            xmin, ymin, xmax, ymax = raster.rectangle_corners(x, y, row_min[layer], row_max[layer], col_min[layer], col_max[layer])
+            statistics[int(layer)] = {"polygons": int(counts[layer]), 
+                                      "vertices": 4*int(counts[layer]), 
+                                      "bytes": int(counts[layer])*gds_boundary_bytes(4),
+                                      "bbox": np.array([[xmin, ymin], [xmax, ymax]])}
+        return statistics
     
 
     
@@ -228,10 +479,114 @@ class GDSMask():
         """ Writes layout to gds file using gdspy library"""
         self.gdslib.write_gds(filename, cells, timestamp, binary_cells)
         print("Saved %s"%(filename))
+    
+    def write_oasis(self, filename, compression_level=2, cblocks=True):
+        """
+        Writes layout to OASIS file, converting the gds written by gdspy with the klayout pya library 
+        (see gds_klops.write_layout for the compression options)
+        """
+        assert self.gdslib is not None, "%s"%self._gdslib_init_error
+        with gds_output(filename, compression_level=compression_level, cblocks=cblocks) as gdsfile:
+            self.gdslib.write_gds(gdsfile)
+        print("Saved %s"%(filename))
+        
+    def write_gds_tiled(self, filename, tile_size=1024, cellname='TOP', merge=False, merge_method="boolean", break_vertices=250, deduplicate=False):
+        """
+        Converts the discretized aperture in raster mode and writes it to a gds file tile by tile, 
+        using gdspy.GdsWriter. Each tile of tile_size x tile_size pixels is written to its own cell 
+        as soon as it is converted, and the top cell references all the tile cells, so that the memory 
+        used is bounded by one tile regardless of the size of the mask. The full layout is never 
+        stored in GDSMask.gdslib. If filename has an OASIS extension (.oas), the tiles are streamed into 
+        a temporary gds file that is converted into OASIS at the end (see gds_klops.gds_output).
+        Merged polygons (see layer_polygons) do not extend across the borders of the tiles.
+        
+        With deduplicate, the tiles are hashed and each unique tile is written only once, so that 
+        periodic masks (gratings, Dammann arrays, tiled holograms) scale with the number of unique tiles. 
+        Repeated tiles in consecutive columns and rows are placed as a single cell array.
+        
+        Args:
+            :filename:          name of the gds (or OASIS) file
+            :tile_size:         number of pixels in each side of the tiles
+            :cellname:          name of the topcell referencing the tile cells
+            :merge:             default False. If True, will merge the pixel rectangles inside each tile
+            :merge_method:      default "boolean". Can also accept "outline"
+            :break_vertices:    threshold value to speed up the merging of polygons
+            :deduplicate:       default False. If True, repeated tiles reference the same cell
+        """
+        assert merge_method in ("boolean", "outline"), "merge_method must be 'boolean' or 'outline'"
+        assert tile_size >= 1, "tile_size must be a positive integer"
+        
+        self.layers = np.arange(len(self.levels))
+        datatype = 0
+        
+        # tile cells are written in local coordinates with the first pixel corner at the origin
+        pixel_x = self.mask.pixel_x/self.units
+        pixel_y = self.mask.pixel_y/self.units
+        x_local = (np.arange(max(tile_size, 2))+0.5)*pixel_x
+        y_local = (np.arange(max(tile_size, 2))+0.5)*pixel_y
+        x0 = self.mask.x[0]/self.units - pixel_x/2
+        y0 = self.mask.y[0]/self.units - pixel_y/2
+        
+        tiles = list(raster.iterate_blocks(self.aperture.shape, tile_size))
+        total_tiles = len(tiles)
+        
+        # index of the cell of each tile (NaN for empty tiles)
+        tile_cells = np.full((-(-self.aperture.shape[0]//tile_size), -(-self.aperture.shape[1]//tile_size)), np.nan)
+        cellnames = []
+        unique_tiles = {}
+        if self.verbose:
+            print("Writing %d tiles of %dx%d pixels"%(total_tiles, tile_size, tile_size))
+        
+        topcell = gdspy.Cell(cellname, exclude_from_current=True)
+        
+        with Timer("Total time writing GDS"), gds_output(filename) as gdsfile:
+            writer = gdspy.GdsWriter(gdsfile, unit=self.units, precision=self.precision)
+            for i, (r0, r1, c0, c1) in enumerate(tiles):
+                tile_row, tile_col = r0//tile_size, c0//tile_size
+                tile = np.rint(self.aperture[r0:r1, c0:c1])
+                if deduplicate:
+                    key = (tile.shape, hashlib.sha1(np.ascontiguousarray(tile).tobytes()).digest())
+                    if key in unique_tiles:
+                        tile_cells[tile_row, tile_col] = unique_tiles[key]
+                        continue
+                
+                tilecell = gdspy.Cell("%s_%d_%d"%(cellname, tile_row, tile_col), exclude_from_current=True)
+                for layer in self.layers:
+                    polygons = layer_polygons(tile == layer, x_local, y_local, merge, merge_method, break_vertices, verbose=False)
+                    if len(polygons) > 0:
+                        tilecell.add(gdspy.PolygonSet(polygons, int(layer), datatype))
+                
+                if len(tilecell.polygons) > 0:
+                    writer.write_cell(tilecell)
+                    tile_cells[tile_row, tile_col] = len(cellnames)
+                    cellnames.append(tilecell.name)
+                if deduplicate:
+                    unique_tiles[key] = tile_cells[tile_row, tile_col]
+                if self.verbose:
+                    progress_bar((i+1)/total_tiles)
+            if self.verbose:
+                progress_bar(1)
+                print("Written %d tile cells"%(len(cellnames)))
+            
+            # places equal tile cells in consecutive columns and rows as a single array (see raster.raster_rectangles)
+            # the references are made by name, as the tile cells are not kept in memory
+            spacing = (tile_size*pixel_x, tile_size*pixel_y)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                for cell_index, tr0, tr1, tc0, tc1 in zip(*raster.raster_rectangles(tile_cells)):
+                    origin = (x0 + tc0*spacing[0], y0 + tr0*spacing[1])
+                    if (tr1-tr0 == 1) and (tc1-tc0 == 1):
+                        topcell.add(gdspy.CellReference(cellnames[int(cell_index)], origin))
+                    else:
+                        topcell.add(gdspy.CellArray(cellnames[int(cell_index)], tc1-tc0, tr1-tr0, spacing, origin))
+            
+            writer.write_cell(topcell)
+            writer.close()
+        print("Saved %s"%(filename))
         
         
 
-    def create_layout(self, mode="raster", cellname='TOP', merge=False, break_vertices=250):
+    def create_layout(self, mode="raster", cellname='TOP', merge=False, break_vertices=250, merge_method="boolean", workers=None, contour_method="matplotlib", tile_size=None):
         """
         Creates GDS layout of the discretized aperture
         
@@ -240,6 +595,12 @@ class GDSMask():
             :cellname:      name of the topcell to include all the merged polygons
             :merge:         default False. If True, will merge the individual pixel polygons 
             :break_vertices: threshold value to speed up the merging of polygons
+            :merge_method:  default "boolean" merges consecutive polygons with merge_polygons. 
+                            "outline" traces the outlines of the connected regions of each level (see outline_polygons)
+            :workers:       (optional) number of processes converting the layers in parallel, defaults to None (serial)
+            :contour_method: default "matplotlib" uses plt.contourf in contour mode. 
+                            "marching_squares" traces the contours of each level natively (see contour_polygons)
+            :tile_size:     (optional) with "marching_squares", traces the contours in tiles of tile_size pixels
         
         Returns:
             :gdslib: l      ibrary with topcell will update the class internal gdslib
@@ -248,46 +609,43 @@ class GDSMask():
         if self.gdslib is None:
             self._init_layout()
         assert self.aperture is not None, "Cannot create_layout() as aperture is not yet discretized"
+        self._statistics = None
         
         
         if mode == "raster":
-            return self._create_layout_raster(cellname=cellname, merge=merge, break_vertices=break_vertices)
+            return self._create_layout_raster(cellname=cellname, merge=merge, break_vertices=break_vertices, merge_method=merge_method, workers=workers)
         elif mode == "contour": 
-            return self._create_layout_contour(cellname = cellname)
+            return self._create_layout_contour(cellname = cellname, contour_method=contour_method, tile_size=tile_size)
         else: 
             raise ValueError("Unsuported option!")
         
         
         
-    def _create_layout_raster(self, cellname='mask', merge=True, break_vertices=250):
+    def _create_layout_raster(self, cellname='mask', merge=True, break_vertices=250, merge_method="boolean", workers=None):
         """
-        Creates the gds layout using raster mode where each data point is a pixel rectangle to
-        be defined in the layout
+        Creates the gds layout using raster mode where the data points are converted into pixel rectangles.
+        Each row is run-length encoded so that each rectangle covers a horizontal run of pixels of the
+        same level, and identical runs in consecutive rows are merged into taller rectangles.
+        With merge_method "outline", each level is instead converted into the outlines of its connected regions.
+        Each level is converted independently (see layer_polygons), in a pool of processes if workers is given.
+        The discretized aperture is then shared once with the workers in shared memory, and each worker builds
+        the mask of its levels.
         
         """
-        self.gdslib = gdspy.GdsLibrary()
+        assert merge_method in ("boolean", "outline"), "merge_method must be 'boolean' or 'outline'"
         
-        cell = gdspy.Cell(cellname,exclude_from_current=True)
+        self.gdslib = gdspy.GdsLibrary()
         
         self.layers = np.arange(len(self.levels))
         total_layers = len(self.layers)
         total_points = self.mask.shape[0]*self.mask.shape[1]
         
-        size_x, size_y = self.mask.shape
-        XX = self.mask.XX
-        YY = self.mask.YY
-
-        half_pixel_x = self.mask.pixel_x/2
-        half_pixel_y = self.mask.pixel_y/2
-
         # normalize to units:
-        XX = XX/self.units
-        YY = YY/self.units
-        half_pixel_x = half_pixel_x/self.units
-        half_pixel_y = half_pixel_y/self.units
+        x = np.asarray(self.mask.x)/self.units
+        y = np.asarray(self.mask.y)/self.units
         datatype = 0
         
-        # Creates top cell that will reference the remaining cells
+        # Creates top cell that will include all the polygons
         topcell = gdspy.Cell(cellname, exclude_from_current=True)
     
         # Make evaluation of computational effort
@@ -295,76 +653,53 @@ class GDSMask():
             print("Mask has %d number of points distributed in %d layers"%(total_points, total_layers))       
 
         with Timer("Total time converting to GDS"):
-            # Creates a list of cells where each cell will correspond to a layer, to enable merging afterwards.
-            list_cells = []
-            for layer in self.layers:
-                cellname = "tempcelllayer%d"%(layer)
-
-                cell = gdspy.Cell(cellname,exclude_from_current=True)
-                list_cells.append(cell)
-
-            # Iterates to create a layout in each layer corresponding to one discretized level
-            if self.verbose:
-                print("Creating individual pixel polygons")
-            with Timer("Create Polygons"):
-                for i in range(size_x):
-                    for j in range(size_y):
-
-                        current_point = i*size_x+j
-                        aperture_value = self.aperture[i,j]
-                        
-                        if not np.isnan(aperture_value):
-                            current_layer = int(np.rint(aperture_value))
-                        
-                            x = XX[i,j]
-                            y = YY[i,j]
-                            
-                            # Creates corners of rectangle with center at the data value
-                            rectangle_first_corner = (x-half_pixel_x,y-half_pixel_y)
-                            rectangle_second_corner = (x+half_pixel_x,y+half_pixel_y)
-                            
-                            #Creates rectangle and adds it to the cell corresponding to the current layer
-                            rect = gdspy.Rectangle(rectangle_first_corner, rectangle_second_corner,current_layer, datatype)
-                            cell = list_cells[current_layer]
-                            
-                            # Saves each rectangle to a separate cell so we can merge more easily afterwards
-                            cell.add(rect)
-                        
+            # NaN pixels (e.g. masked regions) are set to -1, which is not a layer, so they are not converted
+            aperture = np.where(np.isnan(self.aperture), -1, np.rint(self.aperture)).astype(np.min_scalar_type(-total_layers))
+            
+            if workers is None:
+                list_layer_polygons = []
+                for layer in self.layers:
                     if self.verbose:
-                        progress_bar(current_point/total_points)
-                        
-                if self.verbose: 
-                    progress_bar(1)
-
-            list_cell_refs = []
-            list_merged_polygons = []
-            for i, cell in enumerate(list_cells):
-                
-                # Run merging of polygons 
-                if merge:
-                    total_polygons = len(cell.polygons)
-                    print("Merging layer %d of %d with %d polygons:"%(i,len(list_cells)-1, total_polygons))
+                        print("Converting layer %d of %d:"%(layer, total_layers-1))
                     with Timer():
-                        merged = merge_polygons(cell.polygons, break_vertices=break_vertices, verbose=self.verbose)
-                else:
-                    merged = cell.polygons
-                for m in merged:
-                    list_merged_polygons.append(m)
-                # remove temporary cells from memory
-                self.gdslib.remove(cell)
-                
-            # add all polygons to topcell
-            topcell.add(list_merged_polygons)
+                        list_layer_polygons.append(layer_polygons(aperture == layer, x, y, merge, merge_method, break_vertices, self.verbose))
+            else:
+                if self.verbose:
+                    print("Converting %d layers with %d processes"%(total_layers, workers))
+                # the discretized aperture is shared once with the workers, which build the mask of each level
+                memory = shared_memory.SharedMemory(create=True, size=max(aperture.nbytes, 1))
+                try:
+                    np.ndarray(aperture.shape, dtype=aperture.dtype, buffer=memory.buf)[:] = aperture
+                    convert = partial(_shared_layer_polygons, x=x, y=y, merge=merge, merge_method=merge_method, break_vertices=break_vertices, verbose=False)
+                    with ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared_aperture, 
+                                             initargs=(memory.name, aperture.shape, aperture.dtype)) as executor:
+                        list_layer_polygons = list(executor.map(convert, self.layers))
+                finally:
+                    memory.close()
+                    memory.unlink()
+            
+            # add all polygons to topcell, as one polygon set per layer
+            for layer, polygons in zip(self.layers, list_layer_polygons):
+                if len(polygons) > 0:
+                    topcell.add(gdspy.PolygonSet(polygons, int(layer), datatype))
+            if self.verbose:
+                print("Created %d polygons"%(sum(len(polygons) for polygons in list_layer_polygons)))
+            
             # add topcell to library
             self.gdslib.add(topcell)
 
             return self.gdslib
             
             
-    def _create_layout_contour(self, cellname='TOP'):
+
+    def _create_layout_contour(self, cellname='TOP', contour_method="matplotlib", tile_size=None):
         """
-        Creates the gds layout using contour mode via matplotlib library 
+        Creates the gds layout using contour mode via matplotlib library or via marching squares
         """
+        assert contour_method in ("matplotlib", "marching_squares"), "contour_method must be 'matplotlib' or 'marching_squares'"
+        if contour_method == "marching_squares":
+            return self._create_layout_marching_squares(cellname=cellname, tile_size=tile_size)
+        
         self.gdslib = gdspy.GdsLibrary()
         
         cell = gdspy.Cell(cellname,exclude_from_current=True)
@@ -408,3 +743,33 @@ class GDSMask():
            
 
             return self.gdslib
+
+
+    def _create_layout_marching_squares(self, cellname='TOP', tile_size=None):
+        """
+        Creates the gds layout using contour mode, where the regions of each discretized level are
+        converted into their marching squares contours with holes (see contour_polygons)
+        """
+        self.gdslib = gdspy.GdsLibrary()
+        
+        self.layers = np.arange(len(self.levels))
+        total_layers = len(self.layers)
+        
+        # normalize to units:
+        x = np.asarray(self.mask.x)/self.units
+        y = np.asarray(self.mask.y)/self.units
+        datatype = 0
+        
+        topcell = gdspy.Cell(cellname, exclude_from_current=True)
+        
+        with Timer("Total time converting to GDS"):
+            aperture = np.rint(self.aperture)
+            for layer in self.layers:
+                if self.verbose:
+                    print("Creating contours of layer %d of %d:"%(layer, total_layers-1))
+                polygons = contour_polygons(aperture == layer, x, y, int(layer), datatype, tile_size, verbose=self.verbose)
+                topcell.add(polygons)
+            
+            self.gdslib.add(topcell)
+            
+            return self.gdslib
@@ -9,6 +9,7 @@ from pyMOE.gds_klops import *
 from pyMOE.importing import *
 from pyMOE.plotting import *
 import pyMOE.sag_functions as sag
+import pyMOE.expression as expression
 from pyMOE.aperture import Aperture
 
 import numpy as np 
@@ -155,13 +156,21 @@ def rectangular_aperture(aperture, width, height, corner=None, center=None):
     return aperture
     
 
-def arbitrary_aperture_function(aperture, function, center=(0,0), **function_args):
+def arbitrary_aperture_function(aperture, function, center=(0,0), tiling=None, **function_args):
     """    
     Updates aperture and returns phase mask calculated based on function
     
+    If tiling is given, the function is evaluated in tiles of rows (see expression.ApertureExpression.evaluate), 
+    optionally in a pool of threads and into a memory-mapped output, with the same result as evaluating 
+    the whole grid at once.
+    
     Args: 
         :aperture:          mask of type Aperture
         :function:          function to calculate the phase on 
+        :center:            default (x0=0, y0=0) center of the function
+        :tiling:            (optional) dictionary of tiling options: "tile_rows" (number of rows evaluated at once, 
+                            defaults to 1024), "workers" (number of threads evaluating tiles concurrently) and 
+                            "filename" (.npy file where the output is stored as a memory-mapped array)
         :**function_args:   additional arguments to pass onto the function
     Returns:
         :aperture:          aperture with fresnel phase
@@ -170,6 +179,15 @@ def arbitrary_aperture_function(aperture, function, center=(0,0), **function_arg
     assert type(aperture) is Aperture, "aperture must be of type Aperture"
     assert callable(function), "provided function must be callable"
 
+    if tiling is not None:
+        assert set(tiling) <= {"tile_rows", "workers", "filename"}, "tiling options must be tile_rows, workers or filename"
+        expr = expression.arbitrary_aperture_function(function, center=center, **function_args)
+        aperture = expr.evaluate(aperture, tile_rows=tiling.get("tile_rows", 1024), workers=tiling.get("workers"),
+                                 filename=tiling.get("filename"))
+        if tiling.get("filename") is not None:
+            aperture.aperture.flush()
+        return aperture
+
     x0,y0 = center
      
     output = function(aperture.XX-x0, aperture.YY-y0, **function_args)
@@ -300,7 +318,7 @@ def aperture_operation(aperture1, aperture2, operand):
     assert (type(aperture1) is Aperture) and type(aperture2) is Aperture, "aperture must be of type Aperture"
     assert type(operand) == np.ufunc, "operand must be a numpy function"
 
-    assert np.all(aperture1.XX == aperture2.XX) and np.all(aperture1.YY == aperture2.YY), "Spatial dimensions of aperture1 and aperture2 must be the same"
+    assert aperture1.grid == aperture2.grid, "Spatial dimensions of aperture1 and aperture2 must be the same"
 
 
     aperture3 = create_empty_aperture_from_aperture(aperture1)
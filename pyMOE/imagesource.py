@@ -0,0 +1,151 @@
+"""
+imagesource.py
+Module containing the image sources of the export and dithering functions
+
+open_image returns a 2D array-like of the gray levels of an image, which is sliced tile by tile
+(img[r0:r1, c0:c1]) so that images larger than the memory can be processed:
+    - .npy files are opened as memory maps
+    - raw files (.raw, .bin) are opened as memory maps with the given shape and dtype
+    - TIFF files are read with tifffile (optional), as memory maps if uncompressed, otherwise
+      decoding only the tiles or strips of each slice (see TiffImage, requires zarr)
+    - other files (and TIFF files without tifffile) are read whole with cv2, converted to grayscale
+
+image_source opens the image in a context manager, closing the files opened by open_image at the exit.
+
+"""
+
+from contextlib import contextmanager
+import os
+
+import cv2
+import numpy as np
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+try:
+    import zarr
+except ImportError:
+    zarr = None
+
+
+RAW_EXTENSIONS = (".raw", ".bin")
+TIFF_EXTENSIONS = (".tif", ".tiff")
+
+
+class TiffImage:
+    """
+    Class TiffImage:
+        Lazy 2D array of the first page of a grayscale TIFF file, read through the zarr store of tifffile
+        (tifffile.imread(filename, aszarr=True)). Slicing decodes only the tiles (or strips) of the file
+        that intersect the slice. Can be used as a context manager, closing the file at the exit.
+
+    Args:
+        :filename:      TIFF filename
+
+    Methods:
+        :shape:         shape (rows, columns) of the image
+        :dtype:         data type of the pixels
+        :close:         closes the file
+    """
+    def __init__(self, filename):
+        assert (tifffile is not None) and (zarr is not None), "TiffImage requires tifffile and zarr"
+        self.store = tifffile.imread(filename, aszarr=True, key=0)
+        self.array = zarr.open(self.store, mode="r")
+        assert len(self.array.shape) == 2, "TiffImage only reads grayscale (single sample) images"
+        self.shape = self.array.shape
+        self.dtype = self.array.dtype
+        self.ndim = 2
+
+    def __getitem__(self, key):
+        return self.array[key]
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.array[:, :]
+        return array if dtype is None else array.astype(dtype)
+
+    def close(self):
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_image(source, shape=None, dtype=np.uint8, offset=0):
+    """
+    Opens the image as a 2D array-like of gray levels, read lazily where possible (see module description)
+
+    Args:
+        :source:    image filename, or 2D array (returned as is)
+        :shape:     (raw files only) shape (rows, columns) of the image
+        :dtype:     (raw files only) data type of the pixels, defaults to np.uint8
+        :offset:    (raw files only) number of header bytes before the pixels, defaults to 0
+
+    Returns:
+        :img:       np.ndarray, np.memmap or TiffImage with the gray levels of the image
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        img = np.asarray(source) if not hasattr(source, "shape") else source
+        assert len(img.shape) == 2, "image must be 2D"
+        return img
+
+    filename = os.fspath(source)
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension == ".npy":
+        img = np.load(filename, mmap_mode="r")
+    elif extension in RAW_EXTENSIONS:
+        assert shape is not None, "the shape of raw images must be given"
+        img = np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=tuple(shape))
+    elif (extension in TIFF_EXTENSIONS) and (tifffile is not None) and _is_grayscale_tiff(filename):
+        try:
+            img = tifffile.memmap(filename, mode="r")
+        except ValueError:
+            # compressed or not contiguous
+            img = TiffImage(filename) if zarr is not None else _imread_gray(filename)
+    else:
+        img = _imread_gray(filename)
+
+    assert len(img.shape) == 2, "image must be 2D"
+    return img
+
+
+@contextmanager
+def image_source(source, **image_args):
+    """
+    Context manager opening the image with open_image. The files opened from a filename 
+    (e.g. TiffImage) are closed when leaving the context. 
+    
+    Example of use: 
+        with image_source("mask.tif") as img: 
+            tile = img[0:1024, 0:1024]
+
+    Args:
+        :source:        image filename, or 2D array (not closed)
+        :image_args:    arguments of open_image (shape, dtype, offset of raw files)
+    """
+    img = open_image(source, **image_args)
+    try:
+        yield img
+    finally:
+        if isinstance(source, (str, os.PathLike)) and hasattr(img, "close"):
+            img.close()
+
+
+def _imread_gray(filename):
+    """Reads the whole image file with cv2, converted to grayscale"""
+    img = cv2.imread(filename, cv2.IMREAD_GRAYSCALE)
+    assert img is not None, "Could not read the image file %s"%(filename)
+    return img
+
+
+def _is_grayscale_tiff(filename):
+    """Returns True if the first page of the TIFF file is a grayscale image"""
+    with tifffile.TiffFile(filename) as tif:
+        page = tif.pages[0]
+        return (page.samplesperpixel == 1) and (len(page.shape) == 2)
@@ -12,6 +12,9 @@ from gdspy import FlexPath
 from shapely.geometry import MultiPolygon, Polygon
 import pickle 
 import cv2 
+from numpy.lib.format import open_memmap
+
+import pyMOE.raster as raster
 
 # from gdshelpers.geometry.chip import Cell
 
@@ -341,45 +344,125 @@ def inspect_gds2layersplt(filename, norm, rescale=0, verbose = False, **kwargs )
     
 
 
-def gds2img(infile,outfile,norm, rescaled=0, verbose=False): 
+def gds_layer_polygons(filename, norm, rescale=0):
     """
-    (void) plots the gds for inspection in python matplotlib and saves the figure to image file  
-    Note: if plotting different gds file together, please make sure they are aligned (e.g. centered at origin) 
+    Returns the polygons of ALL gds layers with the gray level of each layer (as in inspect_gds2layersplt), 
+    and the bounding box of the layout 
     
     Args:
-        :infile:    string gds filename (e.g. 'yolo.gds')
-        :outfile:   string img filename (e.g. 'yolo.tiff')
+        :filename:  string gds filename (e.g. 'yolo.gds')
         :norm:      maximum level of gray (e.g. 128)  
-        :rescaled:  if !=0 will rescale the layout 
-        :verb:      if True, shows verbose, defaults to False 
+        :rescale:   if !=0 will rescale the layout 
+    
+    Returns:
+        :layer_polygons:    list of (gray, polygons) in increasing order of layer, with gray from 0 (black) to 255 (white)
+        :bbox:              (xmin, xmax, ymin, ymax) of the layout
     """
+    lib = gdspy.GdsLibrary(infile=filename)
+    pol_dict = {}
+    for cell in lib.top_level():
+        for spec, polygons in cell.get_polygons(by_spec=True).items():
+            pol_dict.setdefault(spec, []).extend(polygons)
+    assert len(pol_dict) > 0, "Cannot find polygons in the GDS file %s"%(filename)
     
-    fig = plt.figure()
+    layers = sorted(set(layer for layer, datatype in pol_dict))
+    layer_polygons = []
+    for i in layers: 
+        #same gray levels as inspect_gds2layersplt, lower levels show more black 
+        if np.max(layers)>=norm: 
+            gss_norm = i/np.max(layers)
+        else: 
+            gss_norm = i/(norm-1)
         
-    cell_multipol, pol_dict, xmn, xmx, ymn, ymx = inspect_gds2layersplt(infile,norm,rescale=rescaled, verbose = verbose, axes=plt)
+        polygons = [np.asarray(pol)*(rescale if rescale!=0 else 1) for (layer, datatype), pols in pol_dict.items() if layer == i for pol in pols]
+        layer_polygons.append((int(np.rint(255*gss_norm)), polygons))
     
-    ax = fig.add_subplot(1,1,1)
-    
-    fig.set_dpi(1)
+    vertices = np.concatenate([pol for gray, polygons in layer_polygons for pol in polygons])
+    bbox = (np.min(vertices[:, 0]), np.max(vertices[:, 0]), np.min(vertices[:, 1]), np.max(vertices[:, 1]))
+    return layer_polygons, bbox
 
-    plt.axis('equal')
-    plt.axis('off')
 
-    plt.tight_layout(pad=0, w_pad=0, h_pad=0) 
-    fig.tight_layout(w_pad=0, h_pad=0, pad =0)
+def rasterize_polygons(layer_polygons, bbox, pixel_size=1, tile_size=None, out=None, background=255):
+    """
+    Rasterizes the polygons into a grayscale image with a scanline (see raster.polygon_mask), writing the gray 
+    level of each layer straight into the array (later layers are drawn over the previous ones). Pixel (i, j) is 
+    the square with top left corner (xmin + j*pixel_size, ymax - i*pixel_size) and is filled if its center is inside 
+    a polygon. The image is rasterized in tiles, so that out can be a memory-mapped array 
+    (e.g. numpy.lib.format.open_memmap) larger than the memory. The edges of the polygons are bucketed once 
+    by bands of rows (see raster.band_edges), so each band is rasterized only with the edges crossing it. 
+    
+    Args:
+        :layer_polygons:    list of (gray, polygons) (see gds_layer_polygons)
+        :bbox:              (xmin, xmax, ymin, ymax) of the image 
+        :pixel_size:        size of the pixels in the units of the polygons, defaults to 1 
+        :tile_size:         (optional) number of pixels in each side of the tiles, defaults to None (whole image)
+        :out:               (optional) preallocated uint8 output array with the image shape 
+        :background:        gray level of the pixels without polygons, defaults to 255 (white)
     
-    plt.gca().set_axis_off()
-    plt.subplots_adjust(top = 1, bottom = 0, right = 1, left = 0, hspace = 0, wspace = 0) 
-    plt.margins(0,0)
+    Returns:
+        :img:               2D uint8 array with the gray levels
+    """
+    xmin, xmax, ymin, ymax = bbox
+    shape = (int(np.ceil(np.round((ymax-ymin)/pixel_size, 6))), int(np.ceil(np.round((xmax-xmin)/pixel_size, 6))))
+    if out is None:
+        out = np.zeros(shape, dtype=np.uint8)
+    assert out.shape == shape, "out must have the shape of the image %s"%(str(shape))
     
-    fig.set_size_inches(((xmx-xmn)), ((ymx-ymn)))
-
-    fig.savefig("temp.png", bbox_inches=0,pad_inches = 0, dpi=1)
+    tile_size = max(shape) if tile_size is None else tile_size
+    
+    #edges of the polygons of each layer in pixel coordinates (column, row), bucketed by bands of tile_size rows
+    layers = []
+    for gray, polygons in layer_polygons:
+        if len(polygons) > 0:
+            pixel_polygons = [np.stack([(pol[:, 0]-xmin)/pixel_size, (ymax-pol[:, 1])/pixel_size], axis=-1) for pol in polygons]
+            layers.append((gray, raster.band_edges(raster.polygon_edges(pixel_polygons), shape[0], tile_size)))
+    
+    #the scanline of each band is done once, and filled tile by tile 
+    for band, r0 in enumerate(range(0, shape[0], tile_size)):
+        r1 = min(r0+tile_size, shape[0])
+        spans = [(gray, raster.polygon_spans(bands[band], r0, r1)) for gray, bands in layers]
+        for c0 in range(0, shape[1], tile_size):
+            c1 = min(c0+tile_size, shape[1])
+            tile = np.full((r1-r0, c1-c0), background, dtype=np.uint8)
+            for gray, layer_spans in spans:
+                tile[raster.spans_mask(layer_spans, tile.shape, r0, c0)] = gray
+            out[r0:r1, c0:c1] = tile
+    
+    return out
 
-    #remove any white padding
-    im = cv2.imread("temp.png")
 
-    cv2.imwrite(outfile, im)
+def gds2img(infile,outfile,norm, rescaled=0, verbose=False, pixel_size=1, tile_size=None): 
+    """
+    (void) rasterizes the gds into a grayscale image file, with the gray levels of inspect_gds2layersplt 
+    (see rasterize_polygons). No temporary files are written. 
+    Note: if plotting different gds file together, please make sure they are aligned (e.g. centered at origin) 
+    
+    Args:
+        :infile:        string gds filename (e.g. 'yolo.gds')
+        :outfile:       string img filename (e.g. 'yolo.tiff'), or .npy filename, written as a memory map 
+        :norm:          maximum level of gray (e.g. 128)  
+        :rescaled:      if !=0 will rescale the layout 
+        :verb:          if True, shows verbose, defaults to False 
+        :pixel_size:    size of the pixels in the (rescaled) units of the layout, defaults to 1 
+        :tile_size:     (optional) rasterizes tiles of tile_size x tile_size pixels, defaults to None (whole image)
+    """
+    layer_polygons, bbox = gds_layer_polygons(infile, norm, rescale=rescaled)
+    
+    if verbose == True: 
+        print(str(sum(len(polygons) for gray, polygons in layer_polygons))+" polygons found...")
+        print("Gray levels: "+ str([gray for gray, polygons in layer_polygons]))
+        print("xmin, xmax, ymin, ymax are "+ str(bbox))
+    
+    xmn, xmx, ymn, ymx = bbox
+    shape = (int(np.ceil(np.round((ymx-ymn)/pixel_size, 6))), int(np.ceil(np.round((xmx-xmn)/pixel_size, 6))))
     
-    print("Imported file "+infile+" and exported into "+outfile+ " with size "+ str(int(xmx)) + " x " + str(int(ymx)) + " pixels.")
+    if outfile.lower().endswith(".npy"):
+        out = open_memmap(outfile, mode="w+", dtype=np.uint8, shape=shape)
+        rasterize_polygons(layer_polygons, bbox, pixel_size, tile_size, out)
+        out.flush()
+        del out
+    else:
+        im = rasterize_polygons(layer_polygons, bbox, pixel_size, tile_size)
+        cv2.imwrite(outfile, im)
     
+    print("Imported file "+infile+" and exported into "+outfile+ " with size "+ str(shape[1]) + " x " + str(shape[0]) + " pixels.")
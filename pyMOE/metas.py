@@ -9,7 +9,7 @@ import cv2
 import gdspy 
 import numpy as np 
 from pyMOE.utils import progress_bar, Timer
-from pyMOE.gds_klops import rescale_layout, rotate_layout
+from pyMOE.gds_klops import rescale_layout, rotate_layout, gds_output, write_layout
 
 import pya
 
@@ -28,7 +28,7 @@ def metasurface_from_phase(xsiz, ysiz, pixelx, pixely, p, aperture_vals, topcell
         :p:                periodicity in um 
         :aperture_vals:    2D array with the phase  
         :topcellname:      string with name of top cell, e.g. 'TOP'
-        :oufilen:          string filename of output gds
+        :oufilen:          string filename of output gds (or OASIS, if the extension is .oas)
         :gdspyelements:    gdspy element to be used as individual meta-element (also accepts array of such elements for iteration, with same dimension as unique values in aperture_vals). If == 'pillar' (default) -> gdspy circle with 1 um diameter 
         :verbose:          if True, prints during execution 
         :rotation:         array with the rotation angles of unique meta-elements (1:1 correspondence with unique aperture_vals values!), Rotation angle is anti-clockwise in radians. If None (default), sets the rotation angle = 0 for all elements. 
@@ -146,9 +146,9 @@ def metasurface_from_phase(xsiz, ysiz, pixelx, pixely, p, aperture_vals, topcell
     print("Building the metasurface...")
     print("Total of "+str(len(phase_array))+" layers.")
     
-    with Timer():
+    with Timer(), gds_output(outfilen) as gdsfilen:
         gdspy.current_library = gdspy.GdsLibrary() 
-        writer = gdspy.GdsWriter(outfilen,unit=1.0e-6,precision=1.0e-9)
+        writer = gdspy.GdsWriter(gdsfilen,unit=1.0e-6,precision=1.0e-9)
         cell = lib.new_cell(topcellname)
    
         for ids, phase in enumerate(phase_array):          
@@ -221,7 +221,7 @@ def metasurface_from_phase_instances (xsiz, ysiz, pixelx, pixely, p, aperture_va
         :p:                 periodicity in um 
         :aperture_vals:     2D array with the phase  
         :topcellname:       string with name of top cell, e.g. 'TOP'
-        :oufilen:           string filename of output gds
+        :oufilen:           string filename of output gds (or OASIS, if the extension is .oas)
         :gdspyelements:     gdspy element to be used as individual meta-element (also accepts array of such elements for iteration, with same dimension as unique values in aperture_vals). If == 'pillar' (default) -> gdspy circle with 1 um diameter. If 'infile' is provided, ignores this design. 
         :infile:            string with filename to be used as meta-element
         :verbose:           if True, prints during execution 
@@ -430,7 +430,7 @@ def metasurface_from_phase_instances (xsiz, ysiz, pixelx, pixely, p, aperture_va
 
                                 tot_meta = tot_meta + 1
                     
-                    layout.write(outfilen)
+                    write_layout(layout, outfilen)
             progress_bar(1)      
             print("So far "+str(tot_meta)+" elements and counting.")
             
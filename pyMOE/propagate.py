@@ -10,10 +10,12 @@ Here, "propopt" code has been modified and extended for use with apertures and m
 
 import numpy as np
 import scipy.fftpack as sfft 
+from scipy.fft import fft2, ifft2, next_fast_len
 
 import decimal
 
 from pyMOE.utils import simpson2d 
+from pyMOE.utils import simpson2d_coefficients
 
 from scipy import integrate
 
@@ -24,6 +26,7 @@ import dask.bag as db
 from dask.diagnostics import ProgressBar
 
 from pyMOE.utils import progress_bar, Timer
+from pyMOE.field import Screen
 
 def fresnel(z, mask, npixmask, pixsizemask, npixscreen, dxscreen, dyscreen, wavelength):
     """
@@ -213,7 +216,7 @@ def RS_integral(field, screen, wavelength, n=1, parallel_computing=True, simp2d=
         print("Warning: Sampling field pixel is larger than wavelength/2!")
     k = 2* np.pi/(wavelength*n)
 
-    xlen,ylen,zlen = screen.XX.shape
+    xlen,ylen,zlen = screen.shape
 
     if parallel_computing:
         delayed_tasks = []
@@ -239,11 +242,12 @@ def RS_integral(field, screen, wavelength, n=1, parallel_computing=True, simp2d=
         with ProgressBar():
             results = list(dask.compute(*delayed_tasks))
         # print(results)
-        # again we go through the for loop to pop the results and insert it into the screen position
+        # again we go through the for loop to take the results (in the same order) and insert it into the screen position
+        results = iter(results)
         for x_i in range(xlen):
             for y_i in range(ylen):
                 for z_i in range(zlen):
-                    screen.screen[x_i, y_i, z_i] = results.pop(0)
+                    screen.screen[x_i, y_i, z_i] = next(results)
     else:
         with Timer():
             for x_i in range(xlen):
@@ -263,6 +267,281 @@ def RS_integral(field, screen, wavelength, n=1, parallel_computing=True, simp2d=
     return screen
 
 
+def simpson_weights(x, chunk=1024):
+    """
+    Returns the weights of scipy.integrate.simpson for samples at x, such that
+    integrate.simpson(f, x=x) == np.dot(f, weights) (up to rounding).
+    The weights are obtained from the linearity of the integral, by integrating
+    the unit vectors in chunks of rows to bound the memory used.
+
+    Args:
+        :x:         1D array of sample coordinates
+        :chunk:     number of unit vectors integrated at once
+    Returns:
+        :weights:   1D array with the same length as x
+    """
+    x = np.asarray(x)
+    num = len(x)
+    weights = np.zeros(num)
+    for i0 in range(0, num, chunk):
+        i1 = min(i0+chunk, num)
+        unit = np.zeros((i1-i0, num))
+        unit[np.arange(i1-i0), np.arange(i0, i1)] = 1
+        weights[i0:i1] = integrate.simpson(unit, x=x, axis=-1)
+
+    return weights
+
+
+def kernel_RS_batch(field, k, xs, ys, zs, weights_x=None, weights_y=None, weights_xy=None):
+    """
+    Calculates the RS kernel integral of kernel_RS for a block of screen points at once, 
+    with the input field assumed to be at z=0.
+    The propagated field of every point is stacked into a (npoints, Ny, Nx) array and the 
+    Simpson integral is applied as a matrix product with the precalculated weights.
+    
+    Implements the Kernel in Mahajan 2011 part II eq 1-20 
+
+    Args:
+        :field:         input field
+        :k:             Calculated wavenumber k=2pi/(wl*n)
+        :xs,ys,zs:      1D arrays with the x, y, z coordinates of the screen points being evaluated
+        :weights_x:     Simpson weights along field.x (from simpson_weights)
+        :weights_y:     Simpson weights along field.y (from simpson_weights)
+        :weights_xy:    if given, 2D array of weights used instead of weights_x and weights_y (e.g. from simpson2d)
+    Returns:
+        :E:             1D array with the calculated field at each screen point
+    """
+    xs = np.asarray(xs)[:, None, None]
+    ys = np.asarray(ys)[:, None, None]
+    zs = np.asarray(zs)[:, None, None]
+
+    z_field = 0 # the field source is assumed at z=0
+    x = np.asarray(field.x)[None, None, :]
+    y = np.asarray(field.y)[None, :, None]
+    r = np.sqrt( (x-xs)**2 + (y-ys)**2 + (z_field-zs)**2)
+    r2 = r*r
+
+    prop1 = np.exp(r*1.0j*k)/r2
+    prop2 = zs * k/(2*np.pi) *( 1/(r*k) - 1.0j)
+    propE = field.field * prop1 * prop2
+
+    # integrate over the input field by applying the simpson weights
+    if weights_xy is not None: 
+        Exyz = np.tensordot(propE, weights_xy, axes=([1,2],[0,1]))/(2*np.pi)
+    else: 
+        Exyz = np.matmul(np.matmul(propE, weights_x), weights_y)/(2*np.pi)
+
+    return Exyz
+
+
+def RS_integral_batched(field, screen, wavelength, n=1, simp2d=False, block_size=16, verbose=True):
+    """
+    Calculates the Raleyigh Sommerfeld integral of the first kind (Mahajan 2011 part II eq 1-20), receiving an input field and 
+    an observation screen plane on which to calculate the integral. 
+    Same result as RS_integral, but the screen points are evaluated in blocks against the whole field at once (see kernel_RS_batch),
+    avoiding the scheduling of one task per screen point. 
+    
+    Args: 
+        :field:         input Field
+        :screen:        Observation Screen
+        :wavelength:    wavelength to consider
+        :n:             refractive index of the propagation medium (default=1 for vacuum/air)
+        :simp2d:        Defaults False, if True uses the simpson2d coefficients
+        :block_size:    number of screen points evaluated at once, the memory used scales with block_size*field.shape
+        :verbose:       Defaults True, prints the progress bar
+    Returns:
+        :screen:        Returns the screen populated with the result
+    """
+    assert block_size >= 1, "block_size must be a positive integer"
+
+    if (field.pixel_x > wavelength/2) or (field.pixel_y > wavelength/2):
+        print("Warning: Sampling field pixel is larger than wavelength/2!")
+    k = 2* np.pi/(wavelength*n)
+
+    weights_x, weights_y, weights_xy = None, None, None
+    if simp2d: 
+        num = len(field.field)
+        hx = (field.x[-1]-field.x[0])/(num-1)
+        hy = (field.y[-1]-field.y[0])/(num-1)
+        weights_xy = hx * hy / 9 * simpson2d_coefficients(num)
+    else: 
+        weights_x = simpson_weights(field.x)
+        weights_y = simpson_weights(field.y)
+
+    xs = np.atleast_1d(screen.x)
+    ys = np.atleast_1d(screen.y)
+    zs = np.atleast_1d(screen.z)
+
+    # coordinates of the points in one screen plane, ordered as screen.screen[:,:,z_i]
+    YY, XX = np.meshgrid(ys, xs, indexing='ij')
+    XX = XX.ravel()
+    YY = YY.ravel()
+    npoints = len(XX)
+
+    with Timer():
+        for z_i, z in enumerate(zs):
+            plane = np.zeros(npoints, dtype=complex)
+            for i0 in range(0, npoints, block_size):
+                i1 = min(i0+block_size, npoints)
+                ZZ = np.full(i1-i0, z)
+                plane[i0:i1] = kernel_RS_batch(field, k, XX[i0:i1], YY[i0:i1], ZZ, weights_x, weights_y, weights_xy)
+                if verbose:
+                    progress_bar((z_i*npoints+i1)/(len(zs)*npoints))
+
+            screen.screen[:, :, z_i] = plane.reshape((len(ys), len(xs)))
+        if verbose:
+            progress_bar(1)
+    screen.flush()
+
+    return screen
+
+
+
+def RS_fft_shape(field):
+    """
+    Returns the zero padded shape used by the FFT convolution of the field, 
+    at least (2*Ny-1, 2*Nx-1) to avoid the circular wrap around of the convolution 
+    """
+    Ny, Nx = field.shape
+    return next_fast_len(2*Ny-1), next_fast_len(2*Nx-1)
+
+
+def RS_fft_spectrum(field, simp2d=False):
+    """
+    Calculates the spectrum of the zero padded input field, weighted by the Simpson 
+    coefficients of the integral (same weights as RS_integral), to be convolved with the RS kernel 
+    
+    Args:
+        :field:     input field
+        :simp2d:    Defaults False, if True uses the simpson2d coefficients
+    Returns:
+        :spectrum:  2D FFT of the weighted field with shape RS_fft_shape(field)
+    """
+    if simp2d: 
+        num = len(field.field)
+        hx = (field.x[-1]-field.x[0])/(num-1)
+        hy = (field.y[-1]-field.y[0])/(num-1)
+        weights = hx * hy / 9 * simpson2d_coefficients(num)
+    else: 
+        weights = np.outer(simpson_weights(field.y), simpson_weights(field.x))
+
+    return fft2(field.field*weights, s=RS_fft_shape(field))
+
+
+def RS_fft_rho2(field):
+    """
+    Returns the squared lateral distances between field points, in the wrapped order 
+    of the zero padded FFT grid (shape RS_fft_shape(field))
+    """
+    Ly, Lx = RS_fft_shape(field)
+
+    # distances between field points in the wrapped order of the FFT 
+    dx = np.fft.fftfreq(Lx, 1/Lx)*field.pixel_x
+    dy = np.fft.fftfreq(Ly, 1/Ly)*field.pixel_y
+
+    return dx[None,:]**2 + dy[:,None]**2
+
+
+def RS_fft_kernel(field, k, z, rho2=None):
+    """
+    Calculates the spectrum of the RS kernel (Mahajan 2011 part II eq 1-20) at distance z, sampled with the 
+    field pixel on the zero padded grid, i.e. the RS transfer function of the discrete convolution 
+    
+    Args:
+        :field:     input field, defines the sampling of the kernel
+        :k:         Calculated wavenumber k=2pi/(wl*n)
+        :z:         distance between the field and the screen plane
+        :rho2:      (optional) precalculated RS_fft_rho2(field), to reuse between several z
+    Returns:
+        :kernel:    2D FFT of the RS kernel with shape RS_fft_shape(field)
+    """
+    if rho2 is None:
+        rho2 = RS_fft_rho2(field)
+
+    r = np.sqrt(rho2 + z**2)
+    r2 = r*r
+
+    prop1 = np.exp(r*1.0j*k)/r2
+    prop2 = z * k/(2*np.pi) *( 1/(r*k) - 1.0j)
+
+    return fft2(prop1*prop2)
+
+
+def RS_fft(field, z, wavelength, n=1, simp2d=False):
+    """
+    Calculates the Raleyigh Sommerfeld integral of the first kind (Mahajan 2011 part II eq 1-20) of the input field
+    onto a screen plane at distance z, with the same sampling grid of the field. 
+    The integral is calculated as the convolution of the field with the RS kernel using zero padded FFTs, 
+    which corresponds to the same sum as RS_integral at the field sampling points. 
+    
+    Args: 
+        :field:         input Field
+        :z:             distance to the screen plane (z>0)
+        :wavelength:    wavelength to consider
+        :n:             refractive index of the propagation medium (default=1 for vacuum/air)
+        :simp2d:        Defaults False, if True uses the simpson2d coefficients
+    Returns:
+        :screen:        Returns the XY screen at z populated with the result
+    """
+    assert z > 0, "z must be positive"
+
+    if (field.pixel_x > wavelength/2) or (field.pixel_y > wavelength/2):
+        print("Warning: Sampling field pixel is larger than wavelength/2!")
+    k = 2* np.pi/(wavelength*n)
+
+    Ny, Nx = field.shape
+    spectrum = RS_fft_spectrum(field, simp2d)
+    kernel = RS_fft_kernel(field, k, z)
+
+    screen = Screen(field.x, field.y, z)
+    screen.screen[:, :, 0] = ifft2(spectrum*kernel)[:Ny, :Nx]/(2*np.pi)
+
+    return screen
+
+
+def RS_fft_zstack(field, zs, wavelength, n=1, simp2d=False, verbose=True, filename=None):
+    """
+    Calculates the Raleyigh Sommerfeld integral of the first kind (as in RS_fft) of the input field onto 
+    a stack of XY screen planes at each distance in zs, with the same x, y sampling grid of the field. 
+    The spectrum of the input field is calculated only once and each plane only requires the RS transfer
+    function at that z and one inverse FFT.
+    
+    Args: 
+        :field:         input Field
+        :zs:            1D array of distances of the screen planes (z>0)
+        :wavelength:    wavelength to consider
+        :n:             refractive index of the propagation medium (default=1 for vacuum/air)
+        :simp2d:        Defaults False, if True uses the simpson2d coefficients
+        :verbose:       Defaults True, prints the progress bar
+        :filename:      (optional) file to store the screen as a memory-mapped array, written plane by plane
+    Returns:
+        :screen:        Returns the XYZ screen populated with the result, with screen.screen[:,:,i] the plane at zs[i]
+    """
+    zs = np.atleast_1d(zs)
+    assert np.all(zs > 0), "zs must be positive"
+
+    if (field.pixel_x > wavelength/2) or (field.pixel_y > wavelength/2):
+        print("Warning: Sampling field pixel is larger than wavelength/2!")
+    k = 2* np.pi/(wavelength*n)
+
+    Ny, Nx = field.shape
+    spectrum = RS_fft_spectrum(field, simp2d)
+    rho2 = RS_fft_rho2(field)
+
+    screen = Screen(field.x, field.y, zs, filename=filename)
+
+    with Timer():
+        for z_i, z in enumerate(zs):
+            kernel = RS_fft_kernel(field, k, z, rho2=rho2)
+            screen.screen[:, :, z_i] = ifft2(spectrum*kernel)[:Ny, :Nx]/(2*np.pi)
+            if verbose:
+                progress_bar(z_i/len(zs))
+        if verbose:
+            progress_bar(1)
+    screen.flush()
+
+    return screen
+
     
     
 ##################################################
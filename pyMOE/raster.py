@@ -0,0 +1,486 @@
+"""
+raster.py
+Module containing vectorized functions to convert raster (pixel) arrays into polygons, and polygons into raster arrays
+
+The functions work on 2D arrays of discretized values (e.g. Aperture.aperture_discretized or a
+grayscale image) and return numpy arrays, independent of the GDS library used to write them.
+
+"""
+
+import numpy as np
+
+
+def raster_runs(array):
+    """
+    Run-length encodes each row of the array, where a run is a horizontal sequence of equal pixels.
+    NaN pixels are not included in any run.
+
+    Args:
+        :array:     2D array of (discretized) values
+
+    Returns:
+        :values:    value of each run
+        :rows:      row of each run
+        :c0, c1:    first column and last+1 column of each run
+    """
+    array = np.asarray(array)
+    assert array.ndim == 2, "array must be 2D"
+    h, w = array.shape
+
+    # a run starts at the first column and wherever the value changes along the row
+    change = np.ones((h, w), dtype=bool)
+    change[:, 1:] = array[:, 1:] != array[:, :-1]
+
+    starts = np.flatnonzero(change)
+    ends = np.append(starts[1:], h*w)
+    rows = starts // w
+    c0 = starts - rows*w
+    c1 = ends - rows*w
+    values = array[rows, c0]
+
+    if np.issubdtype(array.dtype, np.floating):
+        valid = ~np.isnan(values)
+        values, rows, c0, c1 = values[valid], rows[valid], c0[valid], c1[valid]
+
+    return values, rows, c0, c1
+
+
+def raster_rectangles(array):
+    """
+    Decomposes the array into rectangles of equal pixels. Each row is run-length encoded (see raster_runs)
+    and runs with the same columns and value in consecutive rows are merged into taller rectangles.
+    NaN pixels are not included in any rectangle.
+
+    Args:
+        :array:     2D array of (discretized) values
+
+    Returns:
+        :values:    value of each rectangle
+        :r0, r1:    first row and last+1 row of each rectangle
+        :c0, c1:    first column and last+1 column of each rectangle
+    """
+    values, rows, c0, c1 = raster_runs(array)
+    if len(values) == 0:
+        return values, rows, rows+1, c0, c1
+
+    # sort the runs by columns, value and row, so that runs to be merged are consecutive
+    order = np.lexsort((rows, values, c1, c0))
+    values, rows, c0, c1 = values[order], rows[order], c0[order], c1[order]
+
+    # a run continues the previous rectangle if it is the same run in the next row
+    continues = np.zeros(len(values), dtype=bool)
+    continues[1:] = (c0[1:] == c0[:-1]) & (c1[1:] == c1[:-1]) & (values[1:] == values[:-1]) & (rows[1:] == rows[:-1]+1)
+
+    first = np.flatnonzero(~continues)
+    last = np.append(first[1:], len(values)) - 1
+
+    values, r0, r1, c0, c1 = values[first], rows[first], rows[last]+1, c0[first], c1[first]
+
+    # return the rectangles ordered by rows
+    order = np.lexsort((c0, r0))
+    return values[order], r0[order], r1[order], c0[order], c1[order]
+
+
+def rectangle_corners(x, y, r0, r1, c0, c1):
+    """
+    Returns the coordinates of the corners of pixel rectangles, where pixel (i, j) is centered at (x[j], y[i])
+
+    Args:
+        :x:         Vector for the x axis of the pixels
+        :y:         Vector for the y axis of the pixels
+        :r0, r1:    first row and last+1 row of each rectangle
+        :c0, c1:    first column and last+1 column of each rectangle
+
+    Returns:
+        :xmin, ymin, xmax, ymax:    arrays with the corners of each rectangle
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    half_pixel_x = (x[1]-x[0])/2
+    half_pixel_y = (y[1]-y[0])/2
+
+    return x[c0]-half_pixel_x, y[r0]-half_pixel_y, x[c1-1]+half_pixel_x, y[r1-1]+half_pixel_y
+
+
+def rectangle_polygons(xmin, ymin, xmax, ymax):
+    """
+    Returns the rectangles as an array of polygons with shape (n, 4, 2)
+
+    Args:
+        :xmin, ymin, xmax, ymax:    arrays with the corners of each rectangle
+    """
+    return np.stack([np.stack([xmin, ymin], axis=-1),
+                     np.stack([xmax, ymin], axis=-1),
+                     np.stack([xmax, ymax], axis=-1),
+                     np.stack([xmin, ymax], axis=-1)], axis=1)
+
+
+def _true_runs(mask):
+    """Returns rows, first column and last+1 column of the runs of True values along the rows of mask"""
+    padded = np.zeros((mask.shape[0], mask.shape[1]+2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    diff = np.diff(padded, axis=1)
+    rows, c0 = np.nonzero(diff == 1)
+    _, c1 = np.nonzero(diff == -1)
+    return rows, c0, c1
+
+
+def trace_outlines(mask):
+    """
+    Traces the outlines of the True regions of the mask along the pixel edges, in a single pass.
+    Vertices are pixel corners (column, row), with pixel (i, j) covering [j, j+1]x[i, i+1].
+    Outer outlines are counter-clockwise (positive area) and outlines of holes are clockwise,
+    so the region is always on the left. Regions are 4-connected: pixels touching only at a
+    corner belong to separate outlines.
+
+    Args:
+        :mask:      2D boolean array
+
+    Returns:
+        :outlines:  list of (n, 2) integer arrays with the vertices of each outline
+        :pixels:    (number of outlines, 2) array with the (row, column) of a pixel inside each outline
+        :areas:     signed area of each outline, in pixels
+    """
+    mask = np.asarray(mask, dtype=bool)
+    assert mask.ndim == 2, "mask must be 2D"
+    h, w = mask.shape
+
+    padded = np.zeros((h+2, w+2), dtype=bool)
+    padded[1:-1, 1:-1] = mask
+    below = padded[:-2, 1:-1]
+    above = padded[2:, 1:-1]
+    left = padded[1:-1, :-2]
+    right = padded[1:-1, 2:]
+
+    # straight boundary segments in each direction (0: +x, 1: +y, 2: -x, 3: -y), with the region on the left
+    r, a, b = _true_runs(mask & ~below)
+    segments = [(a, r, b, r, 0, r, a)]
+    r, a, b = _true_runs(mask & ~above)
+    segments.append((b, r+1, a, r+1, 2, r, a))
+    c, a, b = _true_runs((mask & ~left).T)
+    segments.append((c, b, c, a, 3, a, c))
+    c, a, b = _true_runs((mask & ~right).T)
+    segments.append((c+1, a, c+1, b, 1, a, c))
+
+    sx, sy, ex, ey, direction, pixel_row, pixel_col = [np.concatenate([np.broadcast_to(s[k], s[0].shape) for s in segments]) for k in range(7)]
+    if len(sx) == 0:
+        return [], np.zeros((0, 2), dtype=int), np.zeros(0)
+
+    # each segment continues with the segment starting at its end vertex.
+    # At a vertex shared by two diagonal pixels, turn left to keep the regions 4-connected
+    start_vertex = sy*(w+1) + sx
+    end_vertex = ey*(w+1) + ex
+    order = np.argsort(start_vertex, kind='stable')
+    first = np.searchsorted(start_vertex[order], end_vertex, side='left')
+    last = np.searchsorted(start_vertex[order], end_vertex, side='right')
+    following = order[first]
+    saddle = np.flatnonzero(last-first == 2)
+    second = order[first[saddle]+1]
+    turn_left = direction[second] == (direction[saddle]+1) % 4
+    following[saddle[turn_left]] = second[turn_left]
+
+    return _walk_cycles(following, sx, sy, ex, ey, pixel_row, pixel_col)
+
+
+def _walk_cycles(following, sx, sy, ex, ey, pixel_row, pixel_col, keep=None):
+    """
+    Joins the segments (sx, sy) -> (ex, ey) into closed outlines, where following is the index of
+    the segment that continues each segment. Returns the outlines, the pixel (pixel_row, pixel_col)
+    of the first segment of each outline and the signed area of each outline.
+    If given, only the start vertices of the segments where keep is True are included in the outlines.
+    """
+    following = following.tolist()
+    cycle_of = np.full(len(following), -1)
+    vertices = np.stack([sx, sy], axis=-1)
+    outlines = []
+    starts = []
+    for s in range(len(following)):
+        if cycle_of[s] >= 0:
+            continue
+        cycle = []
+        e = s
+        while cycle_of[e] < 0:
+            cycle_of[e] = len(starts)
+            cycle.append(e)
+            e = following[e]
+        outlines.append(vertices[cycle] if keep is None else vertices[cycle][keep[cycle]])
+        starts.append(s)
+
+    # shoelace formula summed over the segments of each outline
+    areas = np.bincount(cycle_of, weights=0.5*(sx*ey - ex*sy), minlength=len(starts))
+
+    return outlines, np.stack([pixel_row[starts], pixel_col[starts]], axis=-1), areas
+
+
+# marching squares segments of each case (bl + 2*br + 4*tr + 8*tl), from start to end edge of the cell
+# and the corner of the cell inside the region, which is on the left of the segment
+_MARCHING_SQUARES = {
+    1: [("B", "L", "bl")], 2: [("R", "B", "br")], 3: [("R", "L", "bl")],
+    4: [("T", "R", "tr")], 5: [("B", "L", "bl"), ("T", "R", "tr")], 6: [("T", "B", "br")],
+    7: [("T", "L", "bl")], 8: [("L", "T", "tl")], 9: [("B", "T", "bl")],
+    10: [("R", "B", "br"), ("L", "T", "tl")], 11: [("R", "T", "bl")], 12: [("L", "R", "tl")],
+    13: [("B", "R", "bl")], 14: [("L", "B", "br")],
+}
+
+
+def trace_contours(mask):
+    """
+    Traces the contours of the True regions of the mask with marching squares, at the level 0.5 
+    between the pixel centers. Contours are returned with the same conventions as trace_outlines 
+    (vertices in pixel corner coordinates, outer contours counter-clockwise and holes clockwise, 
+    4-connected regions), but cut the corners of the pixels diagonally.
+
+    Args:
+        :mask:      2D boolean array
+
+    Returns:
+        :outlines:  list of (n, 2) arrays with the vertices of each contour
+        :pixels:    (number of contours, 2) array with the (row, column) of a pixel inside each contour
+        :areas:     signed area of each contour, in pixels
+    """
+    mask = np.asarray(mask, dtype=bool)
+    assert mask.ndim == 2, "mask must be 2D"
+    h, w = mask.shape
+
+    # cells between the centers of the padded pixels, so that all contours are closed
+    padded = np.zeros((h+2, w+2), dtype=np.uint8)
+    padded[1:-1, 1:-1] = mask
+    case = padded[:-1, :-1] + 2*padded[:-1, 1:] + 4*padded[1:, 1:] + 8*padded[1:, :-1]
+
+    # midpoints of the edges of cell (i, j) with ids and pixel corner coordinates (x, y)
+    def edge(kind, i, j):
+        if kind == "B":
+            return 2*(i*(w+2)+j), j, i-0.5
+        if kind == "T":
+            return 2*((i+1)*(w+2)+j), j, i+0.5
+        if kind == "L":
+            return 2*(i*(w+2)+j)+1, j-0.5, i
+        return 2*(i*(w+2)+j+1)+1, j+0.5, i
+
+    corners = {"bl": (0, 0), "br": (0, 1), "tr": (1, 1), "tl": (1, 0)}
+
+    start_id, sx, sy, end_id, ex, ey, pixel_row, pixel_col = [[] for _ in range(8)]
+    for code, segments in _MARCHING_SQUARES.items():
+        i, j = np.nonzero(case == code)
+        for start, end, corner in segments:
+            for ids, xs, ys, kind in ((start_id, sx, sy, start), (end_id, ex, ey, end)):
+                edge_id, edge_x, edge_y = edge(kind, i, j)
+                ids.append(edge_id)
+                xs.append(edge_x)
+                ys.append(edge_y)
+            pixel_row.append(i + corners[corner][0] - 1)
+            pixel_col.append(j + corners[corner][1] - 1)
+
+    start_id, sx, sy, end_id, ex, ey, pixel_row, pixel_col = [np.concatenate(a) for a in (start_id, sx, sy, end_id, ex, ey, pixel_row, pixel_col)]
+    if len(sx) == 0:
+        return [], np.zeros((0, 2), dtype=int), np.zeros(0)
+
+    # each edge midpoint is the end of one segment and the start of the next one
+    order = np.argsort(start_id)
+    following = order[np.searchsorted(start_id[order], end_id)]
+
+    # the start vertex of a segment is only kept if the direction changes
+    sx, sy, ex, ey = sx.astype(float), sy.astype(float), ex.astype(float), ey.astype(float)
+    keep = np.ones(len(sx), dtype=bool)
+    keep[following] = ((ex-sx) != (ex-sx)[following]) | ((ey-sy) != (ey-sy)[following])
+
+    return _walk_cycles(following, sx, sy, ex, ey, pixel_row, pixel_col, keep)
+
+
+def signed_area(polygon):
+    """Returns the signed area of the polygon (positive if counter-clockwise)"""
+    x = polygon[:, 0]
+    y = polygon[:, 1]
+    return 0.5*(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def component_outlines(mask, contour=False):
+    """
+    Labels the 4-connected regions of the mask (scipy.ndimage.label) and returns their outlines 
+    along the pixel edges (see trace_outlines) or their marching squares contours (see trace_contours)
+
+    Args:
+        :mask:      2D boolean array
+        :contour:   default False. If True, returns the contours instead of the pixel outlines
+
+    Returns:
+        list with one entry per region, (outer outline, list of outlines of holes)
+    """
+    from scipy import ndimage
+
+    labels, total_labels = ndimage.label(mask)
+    outlines, pixels, areas = trace_contours(mask) if contour else trace_outlines(mask)
+
+    outers = [None]*total_labels
+    holes = [[] for _ in range(total_labels)]
+    for outline, label, area in zip(outlines, labels[pixels[:, 0], pixels[:, 1]], areas):
+        if area > 0:
+            outers[label-1] = outline
+        else:
+            holes[label-1].append(outline)
+
+    return list(zip(outers, holes))
+
+
+def corner_coordinates(vertices, x, y):
+    """
+    Converts pixel corner vertices (column, row) into coordinates, where pixel (i, j) is centered at (x[j], y[i])
+
+    Args:
+        :vertices:  (n, 2) array of pixel corners
+        :x:         Vector for the x axis of the pixels
+        :y:         Vector for the y axis of the pixels
+    """
+    pixel = np.array([x[1]-x[0], y[1]-y[0]])
+    origin = np.array([x[0], y[0]]) - pixel/2
+    return origin + vertices*pixel
+
+
+def iterate_blocks(shape, tile_size):
+    """
+    Iterates over the square tiles of an array, row by row
+
+    Args:
+        :shape:         shape of the 2D array
+        :tile_size:     number of pixels in each side of the tiles
+
+    Returns:
+        generator of (r0, r1, c0, c1) with the first and last+1 rows and columns of each tile
+    """
+    h, w = shape
+    for r0 in range(0, h, tile_size):
+        for c0 in range(0, w, tile_size):
+            yield r0, min(r0+tile_size, h), c0, min(c0+tile_size, w)
+
+
+def polygon_edges(polygons):
+    """
+    Returns the edges of the polygons as arrays, for polygon_mask
+
+    Args:
+        :polygons:  list of (n, 2) arrays of vertices (column, row) in pixel corner coordinates
+
+    Returns:
+        :u0, v0, u1, v1:    columns and rows of the first and second vertex of each edge
+        :index:             index of the polygon of each edge
+    """
+    vertices = np.concatenate(polygons)
+    lengths = np.array([len(polygon) for polygon in polygons])
+    index = np.repeat(np.arange(len(polygons)), lengths)
+
+    # the next vertex wraps around to the first vertex of the same polygon
+    following = np.arange(len(vertices)) + 1
+    ends = np.cumsum(lengths)
+    following[ends-1] = ends - lengths
+
+    u0, v0 = vertices[:, 0], vertices[:, 1]
+    u1, v1 = vertices[following, 0], vertices[following, 1]
+    return u0, v0, u1, v1, index
+
+
+def band_edges(edges, rows, band_rows):
+    """
+    Buckets the edges of the polygons by bands of rows, so that each band of rows is rasterized only with the
+    edges crossing it (see polygon_spans). The edges are sorted into the bands once, edges spanning several
+    bands are in all of them, and the edges not crossing the center of any row are dropped (e.g. horizontal).
+
+    Args:
+        :edges:         edges of the polygons in pixel corner coordinates (see polygon_edges)
+        :rows:          number of rows of the image
+        :band_rows:     number of rows of each band
+
+    Returns:
+        list with the edges crossing each band, band b with the rows b*band_rows to (b+1)*band_rows-1
+    """
+    u0, v0, u1, v1, index = edges
+    bands = -(-rows//band_rows)
+
+    # first and last row whose center is crossed by each edge
+    first = np.maximum(np.ceil(np.minimum(v0, v1)-0.5).astype(np.int64), 0)
+    last = np.minimum(np.ceil(np.maximum(v0, v1)-0.5).astype(np.int64)-1, rows-1)
+    crossing = np.flatnonzero(last >= first)
+    first_band, last_band = first[crossing]//band_rows, last[crossing]//band_rows
+    counts = last_band-first_band+1
+
+    edge = np.repeat(crossing, counts)
+    band = np.repeat(first_band, counts) + np.arange(len(edge)) - np.repeat(np.cumsum(counts)-counts, counts)
+    order = np.argsort(band, kind="stable")
+    edge = edge[order]
+    bounds = np.searchsorted(band[order], np.arange(bands+1))
+    return [tuple(array[edge[bounds[b]:bounds[b+1]]] for array in edges) for b in range(bands)]
+
+
+def polygon_spans(edges, r0, r1):
+    """
+    Scanline of polygons: pixel (i, j) is inside a polygon if its center (j+0.5, i+0.5) is inside
+    (even-odd rule in each polygon). Returns the spans of the pixels inside each polygon in the rows r0 to r1-1,
+    which can be filled into several windows of these rows with spans_mask.
+
+    Args:
+        :edges:     edges of the polygons in pixel corner coordinates (see polygon_edges and band_edges)
+        :r0, r1:    first and last+1 rows
+
+    Returns:
+        :rows, starts, stops:   the pixels start <= j < stop of row are inside a polygon
+    """
+    u0, v0, u1, v1, index = edges
+
+    # rows whose center is crossed by each edge, half open in v, inside the rows
+    v_low = np.minimum(v0, v1)
+    v_high = np.maximum(v0, v1)
+    first = np.maximum(np.ceil(v_low-0.5).astype(np.int64), r0)
+    last = np.minimum(np.ceil(v_high-0.5).astype(np.int64)-1, r1-1)
+    counts = np.maximum(last-first+1, 0)
+
+    edge = np.repeat(np.arange(len(u0)), counts)
+    rows = first[edge] + np.arange(len(edge)) - np.repeat(np.cumsum(counts)-counts, counts)
+    x = u0[edge] + (rows+0.5-v0[edge])*(u1[edge]-u0[edge])/(v1[edge]-v0[edge])
+
+    # each polygon crosses each row an even number of times, so sorted crossings pair into intervals
+    order = np.lexsort((x, rows, index[edge]))
+    rows, x = rows[order], x[order]
+    return rows[0::2], np.ceil(x[0::2]-0.5).astype(np.int64), np.ceil(x[1::2]-0.5).astype(np.int64)
+
+
+def spans_mask(spans, shape, r0=0, c0=0):
+    """
+    Fills the spans of polygon_spans into the window of the given shape starting at row r0 and column c0.
+    The mask is the union of the spans.
+
+    Args:
+        :spans:     rows, starts, stops of the spans (see polygon_spans)
+        :shape:     shape of the window
+        :r0, c0:    first row and column of the window, default 0
+
+    Returns:
+        :mask:      2D boolean array with the pixels inside the spans
+    """
+    rows, starts, stops = spans
+    h, w = shape
+    inside = (rows >= r0) & (rows < r0+h) & (starts < c0+w) & (stops > c0)
+    rows = rows[inside]-r0
+    starts = np.clip(starts[inside]-c0, 0, w)
+    stops = np.clip(stops[inside]-c0, 0, w)
+
+    coverage = np.zeros((h, w+1), dtype=np.int32)
+    np.add.at(coverage, (rows, starts), 1)
+    np.add.at(coverage, (rows, stops), -1)
+    return np.cumsum(coverage, axis=1)[:, :w] > 0
+
+
+def polygon_mask(edges, shape, r0=0, c0=0):
+    """
+    Rasterizes polygons with a vectorized scanline: pixel (i, j) is inside a polygon if its center
+    (j+0.5, i+0.5) is inside (even-odd rule in each polygon), and the mask is the union of the polygons.
+    Only the window of the given shape starting at row r0 and column c0 is rasterized, so that large
+    rasters can be done in tiles (see also band_edges, polygon_spans and spans_mask).
+
+    Args:
+        :edges:     edges of the polygons in pixel corner coordinates (see polygon_edges)
+        :shape:     shape of the window
+        :r0, c0:    first row and column of the window, default 0
+
+    Returns:
+        :mask:      2D boolean array with the pixels inside the polygons
+    """
+    return spans_mask(polygon_spans(edges, r0, r0+shape[0]), shape, r0, c0)
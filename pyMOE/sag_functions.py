@@ -9,7 +9,7 @@ import numpy as np
 # from zernike import RZern
 
 
-def fresnel_lens_phase(XX,YY,focal_length,wavelength): 
+def fresnel_lens_phase(XX,YY,focal_length,wavelength, offset=None): 
     """
     returns the COMPLEX PHASE of a fresnel lens with input meshgrid (x,y) with center at (x0,y0)
     
@@ -18,6 +18,7 @@ def fresnel_lens_phase(XX,YY,focal_length,wavelength):
         :YY:            y array from meshgrid 
         :focal_length:  focal distance 
         :wavelength:    wavelength of design
+        :offset:        value subtracted from the phase, by default the minimum of the phase in XX, YY
     
     Note: for angle (in rad), call numpy.angle(...)
     """
@@ -25,7 +26,9 @@ def fresnel_lens_phase(XX,YY,focal_length,wavelength):
     rc = np.sqrt((XX)**2 + (YY)**2)
     fresn = np.exp(1.0j*(focal_length-np.sqrt(focal_length**2 + rc**2))*(2*np.pi)/(wavelength))
     fresn = np.angle(fresn)
-    fresn = fresn-np.min(fresn)
+    if offset is None:
+        offset = np.min(fresn)
+    fresn = fresn-offset
     
     return fresn     
 
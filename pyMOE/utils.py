@@ -113,6 +113,22 @@ def simpson2d(f,ax,bx,ay,by):
     hy = (by-ay)/(num-1)
     h = hx * hy / 9
 
+    scxy = simpson2d_coefficients(num)
+
+    # integral    
+    tint = h * np.sum(np.sum(scxy * f))
+    
+    return tint
+
+
+def simpson2d_coefficients(num):
+    """
+    Returns the 2D array of Simpson coefficients used by simpson2d for a num by num array.
+    As the integral is linear in f, h*coefficients are the weights of each sample.
+    
+    Arguments: 
+        :num:       number of points along each side of the array 
+    """
     # Simpson coefficients 
     #1 4 2 4 ...2 4 1
     sc = 2*np.ones(num)
@@ -130,8 +146,5 @@ def simpson2d(f,ax,bx,ay,by):
     
     #print(scxy)
 
-    # integral    
-    tint = h * np.sum(np.sum(scxy * f))
-    
-    return tint
+    return scxy
 
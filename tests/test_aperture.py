@@ -17,6 +17,16 @@ def test_aperture_create_aperture():
     assert mask.aperture.size >0
 
 
+def test_aperture_grid():
+    x = np.linspace(-500,500,101)
+    y = np.linspace(-200,200,41)
+    mask = moe.Aperture(x,y)
+    XX, YY = np.meshgrid(x, y)
+
+    assert mask.shape == XX.shape
+    assert np.all(mask.XX == XX) and np.all(mask.YY == YY)
+
+
 def test_aperture_set_phase():
     x = np.linspace(-500,500,101)
     y = np.linspace(-500,500,101)
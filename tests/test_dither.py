@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+import pyMOE as moe
+
+milli = 1e-3
+micro = 1e-6
+nano = 1e-9
+
+
+def test_floyd_steinberg_engines():
+
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (37, 53)).astype(np.uint8)
+
+    _, img_loop = moe.dither.floyd_steinberg(img, engine="python")
+    _, img_numpy = moe.dither.floyd_steinberg(img, engine="numpy")
+
+    assert np.array_equal(img_loop, img_numpy)
+    assert set(np.unique(img_numpy)) <= {0, 255}
+
+
+def test_floyd_steinberg_mean():
+
+    img = np.full((64, 64), 64, dtype=np.uint8)
+
+    _, img_dither = moe.dither.floyd_steinberg(img)
+
+    # a quarter of the pixels are white
+    assert np.isclose(np.mean(img_dither == 255), 0.25, atol=0.02)
+
+
+def test_error_diffusion_engines():
+
+    rng = np.random.default_rng(1)
+    array = rng.random((20, 31))
+
+    for kernel in moe.dither.ERROR_DIFFUSION_KERNELS:
+        indices_loop = moe.dither.error_diffusion(array, kernel, levels=(0, 0.3, 1), engine="python")
+        indices_numpy = moe.dither.error_diffusion(array, kernel, levels=(0, 0.3, 1), engine="numpy")
+        assert np.array_equal(indices_loop, indices_numpy)
+
+
+def test_error_diffusion_serpentine_engines(monkeypatch):
+
+    rng = np.random.default_rng(2)
+    array = rng.random((20, 31))
+    indices_loop = moe.dither.error_diffusion(array, serpentine=True, levels=(0, 1), engine="python")
+
+    # the numpy engine cannot scan serpentine, and "auto" without numba warns of the pixel loop
+    with pytest.raises(AssertionError):
+        moe.dither.error_diffusion(array, serpentine=True, levels=(0, 1), engine="numpy")
+    monkeypatch.setattr(moe.dither, "numba", None)
+    with pytest.warns(UserWarning):
+        indices_auto = moe.dither.error_diffusion(array, serpentine=True, levels=(0, 1))
+    assert np.array_equal(indices_loop, indices_auto)
+
+
+def test_dither_aperture():
+
+    mask = moe.generate.create_empty_aperture(-500*micro, 500*micro, 64, -500*micro, 500*micro, 64,)
+    mask = moe.generate.fresnel_phase(mask, 50*milli, 532*nano)
+
+    for method in ["floyd_steinberg", "jarvis_judice_ninke", "stucki", "bayer", "blue_noise"]:
+        dithered = moe.generate.create_empty_aperture(-500*micro, 500*micro, 64, -500*micro, 500*micro, 64,)
+        dithered.aperture = np.copy(mask.aperture)
+        dithered = moe.dither.dither(dithered, method=method)
+
+        # the dithered aperture keeps the mean value
+        assert dithered.discretized_flag
+        assert set(np.unique(dithered.aperture_discretized)) <= {0, 1}
+        assert np.isclose(np.mean(dithered.aperture), np.mean(mask.aperture), rtol=0.05)
+
+
+def test_error_diffusion_tiled(tmp_path):
+
+    image = np.random.default_rng(0).random((60, 80))*255
+    np.save(tmp_path/"image.npy", image)
+
+    for kernel in moe.dither.ERROR_DIFFUSION_KERNELS:
+        indices = moe.dither.error_diffusion(image, kernel, levels=(0, 100, 255), engine="numpy")
+        indices_tiled = moe.dither.error_diffusion_tiled(str(tmp_path/"image.npy"), kernel, levels=(0, 100, 255), tile_size=16,
+                                                         workers=2, filename=str(tmp_path/"indices.npy"))
+        assert np.array_equal(indices, indices_tiled)
+        assert np.array_equal(indices, np.load(tmp_path/"indices.npy"))
+
+
+def test_dither_aperture_levels():
+
+    mask = moe.generate.create_empty_aperture(-500*micro, 500*micro, 64, -500*micro, 500*micro, 64,)
+    mask = moe.generate.fresnel_phase(mask, 50*milli, 532*nano)
+    original = np.copy(mask.aperture)
+
+    digitized = moe.generate.create_empty_aperture(-500*micro, 500*micro, 64, -500*micro, 500*micro, 64,)
+    digitized.aperture = np.copy(original)
+    digitized.discretize(4)
+
+    mask.discretize(4, method="floyd_steinberg")
+
+    # same levels as the digitized aperture, with a local mean closer to the clipped original
+    assert np.allclose(mask.levels, digitized.levels)
+    assert set(np.unique(mask.aperture_discretized)) <= {0, 1, 2, 3}
+    def local_mean(array):
+        return array.reshape(16, 4, 16, 4).mean(axis=(1, 3))
+    clipped = np.clip(original, mask.levels[0], mask.levels[-1])
+    assert np.abs(local_mean(mask.aperture)-local_mean(clipped)).mean() < np.abs(local_mean(digitized.aperture)-local_mean(clipped)).mean()
+
+    gdsmask = moe.GDSMask(mask)
+    assert len(gdsmask.levels) == 4
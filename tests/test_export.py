@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+import gdspy
+import pyMOE as moe
+
+
+def make_image(tmp_path):
+    """Writes image.png with two rectangles at gray level 100 and one at 200, and returns the image"""
+    img = np.zeros((40, 30), dtype=np.uint8)
+    img[5:20, 3:12] = 100
+    img[10:35, 15:28] = 100
+    img[30:, :5] = 200
+    cv2.imwrite(str(tmp_path/"image.png"), img)
+    return img
+
+
+def test_grayim2gds_levels(tmp_path):
+
+    img = make_image(tmp_path)
+
+    moe.export.grayim2gds_levels(str(tmp_path/"image.png"), str(tmp_path/"image.gds"), 1, 2, band_rows=16)
+    areas = gdspy.GdsLibrary(infile=str(tmp_path/"image.gds")).cells["TOP"].area(by_spec=True)
+
+    # one layer per gray level, covering its pixels
+    assert set(areas) == {(0, 0), (100, 0), (200, 0)}
+    for level in [0, 100, 200]:
+        assert np.isclose(areas[(level, 0)], np.sum(img == level)*1*2)
+
+
+def test_grayim2gds_writer_frac(tmp_path):
+
+    img = make_image(tmp_path)
+
+    moe.export.grayim2gds_writer_frac(str(tmp_path/"image.png"), str(tmp_path/"image.gds"), 1, 2, "TOP", 100, nm=16, workers=2)
+    gdslib = gdspy.GdsLibrary(infile=str(tmp_path/"image.gds"))
+    areas = gdslib.cells["TOP"].area(by_spec=True)
+
+    # a single layout with the top cell and one cell per tile (3x2 tiles, all with pixels at the level)
+    assert len(gdslib.cells) == 1 + 6
+    assert np.isclose(areas[(0, 0)], np.sum(img == 100)*1*2)
+
+
+def test_grayim2gds_writer_klops(tmp_path):
+
+    img = make_image(tmp_path)
+
+    moe.export.grayim2gds_writer_klops(str(tmp_path/"image.png"), str(tmp_path/"image.gds"), 1, 2, "TOP", 100, tile_size=16)
+    cell = gdspy.GdsLibrary(infile=str(tmp_path/"image.gds")).cells["TOP"]
+    areas = cell.area(by_spec=True)
+
+    # the merged boxes cover the pixels at the level, merged across the tiles into one polygon per rectangle
+    assert np.isclose(areas[(0, 0)], np.sum(img == 100)*1*2)
+    assert len(cell.polygons) == 2
+
+    moe.export.grayim2gds_writer_klops(str(tmp_path/"image.png"), str(tmp_path/"image.oas"), 1, 2, "TOP", 100)
+    assert (tmp_path/"image.oas").read_bytes().startswith(b"%SEMI-OASIS")
@@ -0,0 +1,58 @@
+import pyMOE as moe
+import numpy as np
+
+micro = 1e-6
+nano = 1e-9
+milli = 1e-3
+
+
+def create_aperture():
+    return moe.generate.create_empty_aperture(-500*micro, 500*micro, 201, -400*micro, 400*micro, 161,)
+
+
+def test_expression_evaluate():
+    aperture1 = moe.generate.fresnel_phase(create_aperture(), 50*milli, 532*nano, radius=450*micro, center=(10*micro, 0))
+    aperture2 = moe.generate.circular_aperture(create_aperture(), radius=300*micro)
+    aperture3 = moe.generate.arbitrary_aperture_function(create_aperture(), moe.sag.spiral, L=8)
+    aperture4 = moe.generate.aperture_add(moe.generate.aperture_multiply(aperture1, aperture2), aperture3)
+
+    lens = moe.expression.fresnel_phase(50*milli, 532*nano, radius=450*micro, center=(10*micro, 0))
+    expr = lens*moe.expression.circular_aperture(300*micro) + moe.expression.arbitrary_aperture_function(moe.sag.spiral, L=8)
+    aperture = expr.evaluate(create_aperture(), tile_rows=7)
+
+    assert np.array_equal(aperture.aperture, aperture4.aperture)
+
+
+def test_expression_from_aperture():
+    aperture1 = moe.generate.circular_aperture(create_aperture(), radius=300*micro)
+    aperture2 = moe.generate.arbitrary_aperture_function(create_aperture(), moe.sag.spiral, L=8)
+
+    expr = moe.expression.aperture_subtract(aperture2, 2*moe.expression.from_aperture(aperture1))
+    aperture = expr.evaluate(create_aperture(), tile_rows=13)
+
+    assert np.array_equal(aperture.aperture, aperture2.aperture - 2*aperture1.aperture)
+
+
+def test_expression_evaluate_tiles_once():
+    rows = []
+    def function(XX, YY, rows_slice):
+        rows.append(rows_slice.start)
+        return XX + 1j*YY
+
+    aperture = moe.expression.ApertureExpression(function).evaluate(create_aperture(), tile_rows=50)
+
+    # each tile is evaluated once, including the first one that gives the type of the output
+    assert sorted(rows) == [0, 50, 100, 150]
+    assert np.iscomplexobj(aperture.aperture)
+
+
+def test_expression_rectangular_aperture():
+    # grid not centered at the origin
+    def create_offset_aperture():
+        return moe.generate.create_empty_aperture(0, 1000*micro, 101, 200*micro, 800*micro, 61,)
+
+    for rectangle_args in [dict(), dict(center=(300*micro, 400*micro)), dict(corner=(100*micro, 300*micro))]:
+        aperture1 = moe.generate.rectangular_aperture(create_offset_aperture(), 400*micro, 200*micro, **rectangle_args)
+        aperture2 = moe.expression.rectangular_aperture(400*micro, 200*micro, **rectangle_args).evaluate(create_offset_aperture(), tile_rows=7)
+        assert np.array_equal(aperture1.aperture, aperture2.aperture)
+        assert np.any(aperture2.aperture == 1)
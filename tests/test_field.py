@@ -0,0 +1,21 @@
+import pyMOE as moe
+import numpy as np
+
+micro = 1e-6
+
+
+def test_screen_coordinates():
+    screen = moe.field.create_screen_XYZ(-5*micro, 5*micro, 11, -2*micro, 2*micro, 5, 1*micro, 3*micro, 3)
+    XX, YY, ZZ = np.meshgrid(screen.x, screen.y, screen.z)
+
+    assert screen.shape == XX.shape
+    assert np.all(screen.XX == XX) and np.all(screen.YY == YY) and np.all(screen.ZZ == ZZ)
+
+
+def test_screen_memmap(tmp_path):
+    screen = moe.field.create_screen_XYZ(-5*micro, 5*micro, 11, -2*micro, 2*micro, 5, 1*micro, 3*micro, 3, filename=str(tmp_path/"screen.dat"))
+    screen.screen[:, :, 1] = 1.0j
+    screen.flush()
+
+    data = np.memmap(tmp_path/"screen.dat", dtype=complex, mode='r', shape=(3, 5, 11))
+    assert np.all(data[1] == 1.0j) and np.all(data[0] == 0)
@@ -0,0 +1,20 @@
+import numpy as np
+import pya
+import pyMOE as moe
+
+
+def test_box_region(tmp_path):
+
+    filename = str(tmp_path/"boxes.gds")
+    with moe.gds_klops.box_region(0.001, filename=filename) as (add_boxes, region):
+        add_boxes(np.array([0, 1000]), np.array([0, 0]), np.array([1000, 3000]), np.array([2000, 1000]))
+
+    # the boxes file has the database unit of the boxes (1 nm), so the region is 2 + 2 um^2
+    layout = pya.Layout()
+    layout.read(filename)
+    assert np.isclose(layout.dbu, 0.001)
+    assert np.isclose(layout.top_cell().dbbox().width(), 3)
+    assert np.isclose(region.area()*layout.dbu**2, 4)
+
+    region.merge()
+    assert region.count() == 1
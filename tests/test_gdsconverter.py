@@ -1,6 +1,5 @@
-
-
-
+import numpy as np
+import gdspy
 import pyMOE as moe
 
 milli = 1e-3
@@ -8,6 +7,14 @@ micro = 1e-6
 nano = 1e-9
 N = 50
 
+def create_discretized_mask():
+    """Fresnel lens (f=50mm, lambda=532nm, R=500µm) on N x N pixels, discretized on 4 levels"""
+    mask = moe.generate.create_empty_aperture(-500*micro, 500*micro, N, -500*micro, 500*micro, N,)
+    mask = moe.generate.fresnel_phase(mask, 50*milli, 532*nano, radius=500*micro)
+    mask.discretize(4)
+    return mask
+
+
 def test_GDSMask():
 
     mask = moe.generate.create_empty_aperture(-500*micro, 500*micro, N, -500*micro, 500*micro, N,)
@@ -25,4 +32,151 @@ def test_GDSMask_create_layout():
     mask.discretize(4)
     gdsmask = moe.GDSMask(mask)
 
-    gdsmask.create_layout(merge=True)
\ No newline at end of file
+    gdsmask.create_layout(merge=True)
+
+
+def test_GDSMask_create_layout_raster_area():
+
+    mask = create_discretized_mask()
+    gdsmask = moe.GDSMask(mask)
+
+    gdslib = gdsmask.create_layout()
+    areas = gdslib.top_level()[0].area(by_spec=True)
+
+    # the rectangles of each layer must cover exactly the pixels of that level
+    pixel_area = mask.pixel_x*mask.pixel_y/gdsmask.units**2
+    for layer in gdsmask.layers:
+        assert np.isclose(areas.get((layer, 0), 0), np.sum(mask.aperture_discretized == layer)*pixel_area)
+    assert len(gdslib.top_level()[0].get_polygons()) < N*N/2
+
+
+def test_GDSMask_create_layout_outline():
+
+    mask = create_discretized_mask()
+    gdsmask = moe.GDSMask(mask)
+
+    gdslib = gdsmask.create_layout(merge=True, merge_method="outline")
+    areas = gdslib.top_level()[0].area(by_spec=True)
+
+    # the merged outlines of each layer must cover exactly the pixels of that level
+    pixel_area = mask.pixel_x*mask.pixel_y/gdsmask.units**2
+    for layer in gdsmask.layers:
+        assert np.isclose(areas.get((layer, 0), 0), np.sum(mask.aperture_discretized == layer)*pixel_area)
+
+
+def test_GDSMask_create_layout_workers():
+
+    mask = create_discretized_mask()
+
+    areas = moe.GDSMask(mask).create_layout(merge=True, merge_method="outline").top_level()[0].area(by_spec=True)
+    areas_workers = moe.GDSMask(mask).create_layout(merge=True, merge_method="outline", workers=2).top_level()[0].area(by_spec=True)
+
+    assert areas.keys() == areas_workers.keys()
+    for spec in areas:
+        assert np.isclose(areas[spec], areas_workers[spec])
+
+
+def test_GDSMask_create_layout_nan():
+
+    # NaN pixels (e.g. masked regions) are not converted to any layer
+    mask = create_discretized_mask()
+    mask.aperture_discretized = mask.aperture_discretized.astype(float)
+    mask.aperture_discretized[:10] = np.nan
+    pixel_area = mask.pixel_x*mask.pixel_y/moe.GDSMask(mask).units**2
+
+    for workers in [None, 2]:
+        gdsmask = moe.GDSMask(mask)
+        areas = gdsmask.create_layout(workers=workers).top_level()[0].area(by_spec=True)
+        for layer in gdsmask.layers:
+            assert np.isclose(areas.get((layer, 0), 0), np.sum(mask.aperture_discretized == layer)*pixel_area)
+        assert sum(areas.values()) < N*N*pixel_area
+        assert gdsmask.statistics.keys() == gdsmask.estimate_statistics().keys()
+
+
+def test_GDSMask_write_gds_tiled(tmp_path):
+
+    mask = create_discretized_mask()
+
+    areas = moe.GDSMask(mask).create_layout().top_level()[0].area(by_spec=True)
+
+    filename = str(tmp_path/"tiled.gds")
+    moe.GDSMask(mask).write_gds_tiled(filename, tile_size=16)
+    gdslib = gdspy.GdsLibrary(infile=filename)
+    topcell = gdslib.cells["TOP"]
+    areas_tiled = topcell.area(by_spec=True)
+
+    assert len(topcell.references) == 16
+    assert areas.keys() == areas_tiled.keys()
+    for spec in areas:
+        assert np.isclose(areas[spec], areas_tiled[spec])
+
+
+def test_GDSMask_write_gds_tiled_deduplicate(tmp_path):
+
+    # grating with a period of 16 pixels
+    mask = moe.generate.create_empty_aperture(-500*micro, 500*micro, 64, -500*micro, 500*micro, 64,)
+    pixels = np.arange(16)*2*np.pi/16
+    mask.aperture = np.tile(np.outer(np.cos(pixels), np.sin(pixels)), (4, 4))
+    mask.discretize(4)
+
+    areas = moe.GDSMask(mask).create_layout().top_level()[0].area(by_spec=True)
+
+    filename = str(tmp_path/"deduplicated.gds")
+    moe.GDSMask(mask).write_gds_tiled(filename, tile_size=16, deduplicate=True)
+    gdslib = gdspy.GdsLibrary(infile=filename)
+    topcell = gdslib.cells["TOP"]
+    areas_tiled = topcell.area(by_spec=True)
+
+    # a single tile cell placed as one 4x4 array
+    assert len(gdslib.cells) == 2
+    assert len(topcell.references) == 1
+    for spec in areas:
+        assert np.isclose(areas[spec], areas_tiled[spec])
+
+
+def test_GDSMask_create_layout_marching_squares():
+
+    mask = create_discretized_mask()
+
+    areas = moe.GDSMask(mask).create_layout(mode="contour", contour_method="marching_squares").top_level()[0].area(by_spec=True)
+    areas_tiled = moe.GDSMask(mask).create_layout(mode="contour", contour_method="marching_squares", tile_size=16).top_level()[0].area(by_spec=True)
+
+    assert len(areas) == 4
+    for spec in areas:
+        assert np.isclose(areas[spec], areas_tiled[spec])
+
+
+def test_GDSMask_statistics():
+
+    mask = create_discretized_mask()
+    gdsmask = moe.GDSMask(mask)
+
+    estimate = gdsmask.estimate_statistics()
+    gdsmask.create_layout()
+    statistics = gdsmask.statistics
+
+    # the estimate is exact for the raster layout without merging
+    assert estimate.keys() == statistics.keys()
+    for layer in statistics:
+        assert estimate[layer]["polygons"] == statistics[layer]["polygons"]
+        assert estimate[layer]["bytes"] == statistics[layer]["bytes"]
+        assert np.allclose(estimate[layer]["bbox"], statistics[layer]["bbox"])
+    assert gdsmask.total_vertices == 4*gdsmask.total_polygons
+
+    # statistics are recalculated for a new layout
+    gdsmask.create_layout(merge=True, merge_method="outline")
+    assert gdsmask.total_polygons < sum(layer["polygons"] for layer in estimate.values())
+
+
+def test_GDSMask_write_oasis(tmp_path):
+
+    mask = create_discretized_mask()
+    gdsmask = moe.GDSMask(mask)
+    gdsmask.create_layout()
+
+    gdsmask.write_gds(str(tmp_path/"mask.gds"))
+    gdsmask.write_oasis(str(tmp_path/"mask.oas"))
+    gdsmask.write_gds_tiled(str(tmp_path/"tiled.oas"), tile_size=16)
+
+    assert (tmp_path/"mask.oas").stat().st_size < (tmp_path/"mask.gds").stat().st_size
+    assert (tmp_path/"tiled.oas").read_bytes().startswith(b"%SEMI-OASIS")
@@ -1,6 +1,6 @@
-
 import pyMOE as moe
 import numpy as np
+import pytest
 
 
 
@@ -91,4 +91,35 @@ def test_aperture_multiply():
     aperture3 = moe.generate.aperture_multiply(aperture1, aperture2)
 
     assert np.all(np.multiply(aperture1.aperture, aperture2.aperture) == aperture3.aperture)
-    
\ No newline at end of file
+    
+def test_aperture_operation_grid_mismatch():
+    micro = 1e-6
+    aperture1 = moe.generate.create_empty_aperture(-500*micro, 500*micro, 101, -500*micro, 500*micro, 101,)
+    aperture2 = moe.generate.create_empty_aperture(-500*micro, 500*micro, 101, -500*micro, 500*micro, 101,)
+    aperture3 = moe.generate.create_empty_aperture(-500*micro, 500*micro, 101, -400*micro, 500*micro, 101,)
+
+    assert aperture1.grid == aperture2.grid
+    assert hash(aperture1.grid) == hash(aperture2.grid)
+    with pytest.raises(AssertionError):
+        moe.generate.aperture_add(aperture1, aperture3)
+
+def test_arbitrary_aperture_function_tiled(tmp_path):
+    micro = 1e-6
+    nano = 1e-9
+    milli = 1e-3
+    aperture1 = moe.generate.create_empty_aperture(-500*micro, 500*micro, 301, -500*micro, 500*micro, 257,)
+    aperture1 = moe.generate.arbitrary_aperture_function(aperture1, moe.sag.fresnel_lens_phase, center=(5*micro, 0), focal_length=50*milli, wavelength=532*nano)
+
+    aperture2 = moe.generate.create_empty_aperture(-500*micro, 500*micro, 301, -500*micro, 500*micro, 257,)
+    aperture2 = moe.generate.arbitrary_aperture_function(aperture2, moe.sag.fresnel_lens_phase, center=(5*micro, 0), focal_length=50*milli, wavelength=532*nano,
+                                                         tiling=dict(tile_rows=20, workers=4, filename=str(tmp_path/"lens.npy")))
+
+    assert isinstance(aperture2.aperture, np.memmap)
+    assert np.array_equal(aperture1.aperture, aperture2.aperture)
+
+    # complex functions keep their type in the memory-mapped output
+    aperture3 = moe.generate.create_empty_aperture(-500*micro, 500*micro, 301, -500*micro, 500*micro, 257,)
+    aperture3 = moe.generate.arbitrary_aperture_function(aperture3, lambda XX, YY: np.exp(1j*XX/micro), 
+                                                         tiling=dict(tile_rows=20, filename=str(tmp_path/"complex.npy")))
+    assert np.iscomplexobj(aperture3.aperture)
+    assert np.array_equal(aperture3.aperture, np.exp(1j*aperture3.XX/micro))
@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+import gdspy
+import pytest
+import pyMOE as moe
+
+
+def make_image():
+    img = np.zeros((40, 30), dtype=np.uint8)
+    img[5:20, 3:12] = 100
+    img[10:35, 15:28] = 200
+    return img
+
+
+def test_open_image(tmp_path):
+
+    img = make_image()
+    np.save(tmp_path/"image.npy", img)
+    img.tofile(tmp_path/"image.raw")
+    cv2.imwrite(str(tmp_path/"image.png"), img)
+
+    npy = moe.imagesource.open_image(str(tmp_path/"image.npy"))
+    raw = moe.imagesource.open_image(str(tmp_path/"image.raw"), shape=img.shape)
+    png = moe.imagesource.open_image(str(tmp_path/"image.png"))
+
+    assert isinstance(npy, np.memmap) and isinstance(raw, np.memmap)
+    for opened in [npy, raw, png]:
+        assert np.array_equal(opened[8:30, 10:20], img[8:30, 10:20])
+
+
+def test_open_image_tiff(tmp_path):
+
+    tifffile = pytest.importorskip("tifffile")
+    img = make_image()
+    tifffile.imwrite(tmp_path/"tiles.tif", img, tile=(16, 16), compression="zlib")
+    tifffile.imwrite(tmp_path/"strips.tif", img, rowsperstrip=7, compression="zlib")
+
+    for filename in ["tiles.tif", "strips.tif"]:
+        with moe.imagesource.image_source(str(tmp_path/filename)) as tiff:
+            # compressed TIFF files are read lazily when zarr is installed, otherwise whole with cv2
+            if moe.imagesource.zarr is not None:
+                assert isinstance(tiff, moe.imagesource.TiffImage)
+            assert np.array_equal(tiff[8:30, 10:20], img[8:30, 10:20])
+            assert np.array_equal(tiff[12], img[12])
+            assert np.array_equal(np.asarray(tiff), img)
+
+
+def test_export_from_npy(tmp_path):
+
+    img = make_image()
+    np.save(tmp_path/"image.npy", img)
+
+    moe.export.grayim2gds_levels(str(tmp_path/"image.npy"), str(tmp_path/"image.gds"), 1, 1, band_rows=16)
+    areas = gdspy.GdsLibrary(infile=str(tmp_path/"image.gds")).cells["TOP"].area(by_spec=True)
+    for level in [0, 100, 200]:
+        assert np.isclose(areas[(level, 0)], np.sum(img == level))
@@ -0,0 +1,26 @@
+import cv2
+import numpy as np
+import gdspy
+import pyMOE as moe
+
+
+def test_gds2img(tmp_path):
+
+    lib = gdspy.GdsLibrary()
+    cell = lib.new_cell("TOP")
+    cell.add(gdspy.Rectangle((0, 0), (40, 20), layer=0))
+    cell.add(gdspy.Rectangle((8, 4), (24, 16), layer=64))
+    cell.add(gdspy.Rectangle((16, 8), (32, 12), layer=64))
+    lib.write_gds(str(tmp_path/"layout.gds"))
+
+    moe.importing.gds2img(str(tmp_path/"layout.gds"), str(tmp_path/"layout.png"), 128, pixel_size=2)
+    moe.importing.gds2img(str(tmp_path/"layout.gds"), str(tmp_path/"layout.npy"), 128, pixel_size=2, tile_size=4)
+    img = cv2.imread(str(tmp_path/"layout.png"), cv2.IMREAD_GRAYSCALE)
+
+    # the overlapping polygons of layer 64 are drawn over layer 0, with 2x2 pixels of 1 unit
+    gray = int(np.rint(255*64/127))
+    assert img.shape == (10, 20)
+    assert np.sum(img == gray) == 8*6 + 4*2
+    assert np.sum(img == 0) == 200 - (8*6 + 4*2)
+    assert np.array_equal(img[2:8, 4:12], np.full((6, 8), gray))
+    assert np.array_equal(np.load(tmp_path/"layout.npy"), img)
@@ -0,0 +1,69 @@
+import pyMOE as moe
+import numpy as np
+
+micro = 1e-6
+nano = 1e-9
+wavelength = 532*nano
+
+
+def create_test_field(N=21):
+    field = moe.field.create_empty_field(-5*micro, 5*micro, N, -5*micro, 5*micro, N)
+    field = moe.field.generate_gaussian_field(field, 1, 3*micro)
+    return field
+
+
+def test_RS_integral_batched():
+    field = create_test_field()
+    screen1 = moe.field.create_screen_XY(-2*micro, 2*micro, 3, -2*micro, 2*micro, 4, 20*micro)
+    screen2 = moe.field.create_screen_XY(-2*micro, 2*micro, 3, -2*micro, 2*micro, 4, 20*micro)
+
+    screen1 = moe.propagate.RS_integral(field, screen1, wavelength)
+    screen2 = moe.propagate.RS_integral_batched(field, screen2, wavelength, block_size=5)
+
+    assert np.allclose(screen1.screen, screen2.screen, rtol=1e-10, atol=0)
+
+
+def test_RS_integral_batched_simp2d():
+    field = create_test_field()
+    screen1 = moe.field.create_screen_YZ(-2*micro, 2*micro, 3, 10*micro, 20*micro, 2)
+    screen2 = moe.field.create_screen_YZ(-2*micro, 2*micro, 3, 10*micro, 20*micro, 2)
+
+    screen1 = moe.propagate.RS_integral(field, screen1, wavelength, simp2d=True)
+    screen2 = moe.propagate.RS_integral_batched(field, screen2, wavelength, simp2d=True)
+
+    assert np.allclose(screen1.screen, screen2.screen, rtol=1e-10, atol=0)
+
+
+def test_RS_fft():
+    field = create_test_field()
+    z = 20*micro
+    screen1 = moe.Screen(field.x, field.y, z)
+
+    screen1 = moe.propagate.RS_integral_batched(field, screen1, wavelength, block_size=64)
+    screen2 = moe.propagate.RS_fft(field, z, wavelength)
+
+    assert screen2.shape == screen1.shape
+    assert np.allclose(screen1.screen, screen2.screen, rtol=1e-9, atol=1e-12*np.abs(screen1.screen).max())
+
+
+def test_RS_fft_zstack():
+    field = create_test_field()
+    zs = np.array([10*micro, 20*micro, 30*micro])
+
+    screen = moe.propagate.RS_fft_zstack(field, zs, wavelength)
+
+    assert screen.shape == (len(field.y), len(field.x), len(zs))
+    for z_i, z in enumerate(zs):
+        plane = moe.propagate.RS_fft(field, z, wavelength)
+        assert np.allclose(screen.screen[:, :, z_i], plane.screen[:, :, 0])
+
+
+def test_RS_fft_zstack_memmap(tmp_path):
+    field = create_test_field()
+    zs = np.array([10*micro, 20*micro])
+
+    screen1 = moe.propagate.RS_fft_zstack(field, zs, wavelength)
+    screen2 = moe.propagate.RS_fft_zstack(field, zs, wavelength, filename=str(tmp_path/"screen.dat"))
+
+    assert isinstance(screen2.screen, np.memmap)
+    assert np.all(screen1.screen == screen2.screen)
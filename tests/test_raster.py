@@ -0,0 +1,70 @@
+import numpy as np
+import pyMOE as moe
+
+
+def test_raster_rectangles():
+
+    rng = np.random.default_rng(0)
+    array = rng.integers(0, 3, (40, 30)).astype(float)
+    array[5:10, 5:10] = np.nan
+
+    values, r0, r1, c0, c1 = moe.raster.raster_rectangles(array)
+
+    # the rectangles must cover each non NaN pixel exactly once with its value
+    covered = np.full(array.shape, np.nan)
+    count = np.zeros(array.shape)
+    for v, a, b, c, d in zip(values, r0, r1, c0, c1):
+        covered[a:b, c:d] = v
+        count[a:b, c:d] += 1
+    assert np.array_equal(covered, array, equal_nan=True)
+    assert np.all(count[~np.isnan(array)] == 1)
+
+
+def test_component_outlines():
+
+    mask = np.zeros((6, 6), dtype=bool)
+    mask[1:5, 1:5] = True
+    mask[2:4, 2:4] = False
+    mask[0, 0] = True
+
+    components = moe.raster.component_outlines(mask)
+
+    # the corner pixel only touches the ring diagonally, so it is a separate region
+    assert len(components) == 2
+    areas = sorted(moe.raster.signed_area(outer) + sum(moe.raster.signed_area(hole) for hole in holes) for outer, holes in components)
+    assert areas == [1, 12]
+
+
+def test_trace_contours():
+
+    mask = np.zeros((5, 5), dtype=bool)
+    mask[2, 2] = True
+    mask[0:2, 0:2] = True
+
+    outlines, pixels, areas = moe.raster.trace_contours(mask)
+
+    # a single pixel is a diamond between the midpoints of its neighbours, and a 2x2 square is an octagon
+    assert sorted(areas) == [0.5, 3.5]
+    assert sorted(len(outline) for outline in outlines) == [4, 8]
+
+
+def test_polygon_mask():
+
+    # square with a square hole, as a single keyhole polygon
+    polygon = np.array([[1, 1], [9, 1], [9, 9], [1, 9], [1, 3], [3, 3], [3, 7], [7, 7], [7, 3], [1, 3]])
+    edges = moe.raster.polygon_edges([polygon])
+    mask = moe.raster.polygon_mask(edges, (10, 10))
+
+    expected = np.zeros((10, 10), dtype=bool)
+    expected[1:9, 1:9] = True
+    expected[3:7, 3:7] = False
+    assert np.array_equal(mask, expected)
+
+    # windows of the mask
+    assert np.array_equal(moe.raster.polygon_mask(edges, (4, 6), 2, 3), expected[2:6, 3:9])
+
+    # each band of rows only gets the edges crossing it, and rasterizes as the whole polygon
+    bands = moe.raster.band_edges(edges, 10, 4)
+    assert [len(band[0]) for band in bands] == [5, 4, 2]
+    for b, band in enumerate(bands):
+        assert np.array_equal(moe.raster.polygon_mask(band, (4, 10), 4*b)[:10-4*b], expected[4*b:4*b+4])